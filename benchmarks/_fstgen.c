@@ -0,0 +1,90 @@
+/*
+ * _fstgen.c -- native value-change loop for generate_testdata.generate_fst.
+ *
+ * Compiled into the `_fstgen` cffi module by fstgen_build.py. The FST
+ * writer entry points are passed in as function pointers taken from
+ * pylibfst's own cffi module, so this file does not link against libfst.
+ */
+
+#include <stdint.h>
+#include <string.h>
+
+typedef void (*fstgen_emit_time_fn)(void *ctx, uint64_t tim);
+typedef void (*fstgen_emit_value_fn)(void *ctx, uint32_t handle, const void *val);
+
+/* bits8[v] is the 8-character binary ASCII representation of byte v. */
+static char bits8[256][8];
+static int bits8_ready = 0;
+
+static void init_bits8(void)
+{
+    int v, b;
+
+    for (v = 0; v < 256; v++)
+        for (b = 0; b < 8; b++)
+            bits8[v][b] = (v >> (7 - b)) & 1 ? '1' : '0';
+    bits8_ready = 1;
+}
+
+static uint64_t signal_mod(uint32_t i, int dense)
+{
+    uint64_t mod;
+
+    if (!dense)
+        return (uint64_t)i + 1;
+    mod = ((uint64_t)i + 1) / 10;
+    return mod ? mod : 1;
+}
+
+/*
+ * Emit the initial zeros at t=0 followed by every scheduled value change
+ * for 1 <= t < num_timesteps, in the same order as the Python reference
+ * loop: timestep-major, then signal index.
+ */
+void fstgen_generate(void *ctx, fstgen_emit_time_fn emit_time,
+                     fstgen_emit_value_fn emit_value,
+                     const uint32_t *handles, const uint32_t *sizes,
+                     uint32_t num_signals, uint64_t num_timesteps, int dense)
+{
+    char zeros[33];
+    char value[33];
+    uint64_t t, v;
+    uint32_t i;
+
+    if (!bits8_ready)
+        init_bits8();
+
+    memset(zeros, '0', 32);
+    zeros[32] = '\0';
+    emit_time(ctx, 0);
+    for (i = 0; i < num_signals; i++)
+        emit_value(ctx, handles[i], zeros);
+
+    for (t = 1; t < num_timesteps; t++) {
+        emit_time(ctx, t * 10);
+        for (i = 0; i < num_signals; i++) {
+            if (t % signal_mod(i, dense) != 0)
+                continue;
+            switch (sizes[i]) {
+            case 1:
+                value[0] = (t & 1) ? '1' : '0';
+                value[1] = '\0';
+                break;
+            case 8:
+                v = (t * ((uint64_t)i + 1)) & 0xff;
+                memcpy(value, bits8[v], 8);
+                value[8] = '\0';
+                break;
+            default:
+                v = (t * ((uint64_t)i + 1)) & 0xffffffffu;
+                memcpy(value, bits8[(v >> 24) & 0xff], 8);
+                memcpy(value + 8, bits8[(v >> 16) & 0xff], 8);
+                memcpy(value + 16, bits8[(v >> 8) & 0xff], 8);
+                memcpy(value + 24, bits8[v & 0xff], 8);
+                value[32] = '\0';
+                break;
+            }
+            emit_value(ctx, handles[i], value);
+        }
+    }
+}
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Build the optional ``_fstgen`` cffi module used by generate_testdata.py.
+
+The module runs the FST value-change loop in C (see _fstgen.c). When it is
+not built, generate_fst falls back to the pure Python loop.
+
+Usage:
+    python fstgen_build.py    # writes _fstgen.*.so next to this script
+"""
+
+import os
+
+from cffi import FFI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ffibuilder = FFI()
+ffibuilder.cdef(
+    """
+    typedef void (*fstgen_emit_time_fn)(void *ctx, uint64_t tim);
+    typedef void (*fstgen_emit_value_fn)(void *ctx, uint32_t handle, const void *val);
+
+    void fstgen_generate(void *ctx, fstgen_emit_time_fn emit_time,
+                         fstgen_emit_value_fn emit_value,
+                         const uint32_t *handles, const uint32_t *sizes,
+                         uint32_t num_signals, uint64_t num_timesteps, int dense);
+"""
+)
+
+with open(os.path.join(HERE, "_fstgen.c")) as fp:
+    ffibuilder.set_source("_fstgen", fp.read(), extra_compile_args=["-O3"])
+
+if __name__ == "__main__":
+    # Build in a scratch dir so cffi's generated _fstgen.c does not overwrite ours
+    ffibuilder.compile(
+        tmpdir=os.path.join(HERE, "build"),
+        target=os.path.join(HERE, "_fstgen.*"),
+        verbose=True,
+    )
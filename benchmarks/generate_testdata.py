@@ -9,10 +9,12 @@ Usage:
     python generate_testdata.py                        # medium scale
     python generate_testdata.py --scale small
     python generate_testdata.py --scale large
+    python generate_testdata.py --scale small medium   # several in one run
     python generate_testdata.py --data-dir /tmp/bench
 """
 
 import argparse
+import multiprocessing
 import os
 import sys
 import time
@@ -59,45 +61,280 @@ def format_size(size_bytes: int) -> str:
 
 
 # ---------------------------------------------------------------------------
-# VCD generation (uses pyvcd / VCDWriter)
+# Value-change schedule (shared by the VCD and FST generators)
 # ---------------------------------------------------------------------------
-def generate_vcd(path: str, num_signals: int, num_timesteps: int) -> int:
+# Target number of value changes per time block; bounds per-block memory
+# (the VCD character matrix takes ~50 bytes per change).
+BLOCK_CHANGES = 1 << 18
+
+
+def _signal_size(i: int) -> int:
+    """Bit width of synthetic signal *i* (cycles through 1, 8 and 32 bits)."""
+    return (1, 8, 32)[i % 3]
+
+
+def _signal_mod(i: int, dense: bool) -> int:
+    """Change period of synthetic signal *i*, in timesteps.
+
+    The dense pattern (used for the large scale) reduces the modulus for
+    high-index signals to increase activity and reach the target file size.
+    """
+    return max(1, (i + 1) // 10) if dense else (i + 1)
+
+
+def _signal_mods(num_signals: int, dense: bool):
+    """int64 array of _signal_mod(i, dense) for every signal."""
+    import numpy as np
+
+    return np.array([_signal_mod(i, dense) for i in range(num_signals)], dtype=np.int64)
+
+
+_SCHEDULE_KERNEL = False  # unset; None once numba is known to be missing
+
+
+def _schedule_kernel():
+    """Return the numba-compiled schedule builder, or None without numba.
+
+    The kernel is a counting sort: one pass counts changes per timestep, a
+    prefix sum turns the counts into offsets, and a second pass over the
+    signals in index order fills each timestep's slots. The result is
+    already ordered by (timestep, signal), so no lexsort is needed.
+    """
+    global _SCHEDULE_KERNEL
+    if _SCHEDULE_KERNEL is not False:
+        return _SCHEDULE_KERNEL
+    try:
+        from numba import njit
+    except ImportError:
+        _SCHEDULE_KERNEL = None
+        return None
+    import numpy as np
+
+    @njit(cache=True)
+    def kernel(mods, t0, t1):
+        n = t1 - t0
+        offsets = np.zeros(n + 1, np.int64)
+        for i in range(mods.size):
+            mod = mods[i]
+            for t in range(-(-t0 // mod) * mod, t1, mod):
+                offsets[t - t0 + 1] += 1
+        for k in range(n):
+            offsets[k + 1] += offsets[k]
+        times = np.empty(offsets[n], np.int64)
+        ids = np.empty(offsets[n], np.int64)
+        for i in range(mods.size):
+            mod = mods[i]
+            for t in range(-(-t0 // mod) * mod, t1, mod):
+                pos = offsets[t - t0]
+                times[pos] = t
+                ids[pos] = i
+                offsets[t - t0] = pos + 1
+        return times, ids
+
+    _SCHEDULE_KERNEL = kernel
+    return kernel
+
+
+def build_schedule(num_signals: int, t0: int, t1: int, dense: bool):
+    """Return ``(times, ids)`` of every scheduled change with ``t0 <= t < t1``.
+
+    The arrays are ordered by timestep, then by signal index -- the same
+    order the original nested ``for t ... for i`` loop visited them. Uses
+    the numba kernel when numba is installed, NumPy otherwise.
+    """
+    import numpy as np
+
+    kernel = _schedule_kernel()
+    if kernel is not None:
+        return kernel(_signal_mods(num_signals, dense), t0, t1)
+
+    parts_t = []
+    parts_i = []
+    for i in range(num_signals):
+        mod = _signal_mod(i, dense)
+        t = np.arange(-(-t0 // mod) * mod, t1, mod, dtype=np.int64)
+        parts_t.append(t)
+        parts_i.append(np.full(t.size, i, dtype=np.int64))
+    times = np.concatenate(parts_t)
+    ids = np.concatenate(parts_i)
+    order = np.lexsort((ids, times))
+    return times[order], ids[order]
+
+
+def signal_values(times, ids):
+    """Vectorized value of signal ``ids`` at timestep ``times``.
+
+    1-bit signals toggle with ``t % 2``; wider signals take
+    ``(t * (i + 1)) % 2**size``.
+    """
+    import numpy as np
+
+    mask = np.where(ids % 3 == 1, 0xFF, 0xFFFFFFFF)
+    return np.where(ids % 3 == 0, times & 1, (times * (ids + 1)) & mask)
+
+
+def _changes_per_step(num_signals: int, dense: bool) -> float:
+    """Average number of scheduled changes per timestep."""
+    return sum(1 / _signal_mod(i, dense) for i in range(num_signals))
+
+
+def _time_blocks(num_signals: int, num_timesteps: int, dense: bool):
+    """Split timesteps ``1 <= t < num_timesteps`` into ``(t0, t1)`` blocks of
+    roughly BLOCK_CHANGES scheduled changes each."""
+    step = max(1, int(BLOCK_CHANGES / _changes_per_step(num_signals, dense)))
+    return [(t0, min(t0 + step, num_timesteps)) for t0 in range(1, num_timesteps, step)]
+
+
+def _map_blocks(func, blocks, jobs: int, initializer, initargs):
+    """Yield ``func(block)`` for each block, in order.
+
+    Time blocks are independent, so with ``jobs > 1`` they are computed in a
+    ``multiprocessing.Pool`` while the caller (which owns the output file or
+    FST context) consumes results serially. *initializer* installs the
+    per-file state that *func* reads from module globals.
+    """
+    jobs = min(jobs, len(blocks))
+    if jobs <= 1:
+        initializer(*initargs)
+        yield from map(func, blocks)
+        return
+    with multiprocessing.Pool(jobs, initializer, initargs) as pool:
+        yield from pool.imap(func, blocks)
+
+
+# Per-file state for block workers, installed by _init_block_worker
+_BLOCK_STATE = None
+
+
+def _init_block_worker(*state) -> None:
+    global _BLOCK_STATE
+    _BLOCK_STATE = state
+
+
+# ---------------------------------------------------------------------------
+# VCD generation (pyvcd header + vectorized NumPy body)
+# ---------------------------------------------------------------------------
+# Output buffer size; each formatted block bypasses it as one large write.
+VCD_WRITE_BUFFER = 1 << 20
+
+
+def _format_vcd_block(times, ids, vals, ident_chars, ident_lens, ndigits):
+    """Format a time-ordered block of value changes as VCD text.
+
+    Each change becomes one fixed-width row of characters --
+    ``#<timestamp>\n`` (first change of a timestep only), then either
+    ``<bit><ident>\n`` or ``b<bits> <ident>\n`` -- plus a keep-mask that
+    drops the unused columns (leading zeros, padding). Flattening the kept
+    cells row-major yields exactly the text pyvcd writes.
+    """
+    import numpy as np
+
+    n = times.size
+    ident_width = ident_chars.shape[1]
+    width = (ndigits + 2) + 34 + ident_width + 1
+    buf = np.empty((n, width), dtype=np.uint8)
+    keep = np.empty((n, width), dtype=bool)
+
+    # "#<timestamp>\n", only where the timestep changes
+    new_ts = np.empty(n, dtype=bool)
+    new_ts[0] = True
+    np.not_equal(times[1:], times[:-1], out=new_ts[1:])
+    ts = times * 10
+    pow10 = 10 ** np.arange(ndigits - 1, -1, -1, dtype=np.int64)
+    ts_len = 1 + np.count_nonzero(ts[:, None] >= pow10[:-1], axis=1)
+    buf[:, 0] = ord("#")
+    keep[:, 0] = new_ts
+    buf[:, 1:ndigits + 1] = (ts[:, None] // pow10) % 10 + ord("0")
+    keep[:, 1:ndigits + 1] = new_ts[:, None] & (
+        np.arange(ndigits) >= (ndigits - ts_len)[:, None]
+    )
+    buf[:, ndigits + 1] = ord("\n")
+    keep[:, ndigits + 1] = new_ts
+
+    # "b<bits> " for vectors; scalars keep only the least significant bit
+    c = ndigits + 2
+    is_vec = ids % 3 != 0
+    bits = np.unpackbits(vals.astype(">u4").view(np.uint8).reshape(n, 4), axis=1)
+    nbits = np.where(bits.any(axis=1), 32 - bits.argmax(axis=1), 1)
+    buf[:, c] = ord("b")
+    keep[:, c] = is_vec
+    buf[:, c + 1:c + 33] = bits + ord("0")
+    keep[:, c + 1:c + 33] = np.arange(32) >= (32 - nbits)[:, None]
+    buf[:, c + 33] = ord(" ")
+    keep[:, c + 33] = is_vec
+
+    # "<ident>\n"
+    c += 34
+    buf[:, c:c + ident_width] = ident_chars[ids]
+    keep[:, c:c + ident_width] = np.arange(ident_width) < ident_lens[ids][:, None]
+    buf[:, -1] = ord("\n")
+    keep[:, -1] = True
+
+    return buf[keep].tobytes()
+
+
+def _vcd_block(block):
+    """Format the VCD text for timesteps ``t0 <= t < t1`` (block worker)."""
+    import numpy as np
+
+    num_signals, dense, ident_chars, ident_lens, ndigits = _BLOCK_STATE
+    times, ids = build_schedule(num_signals, block[0], block[1], dense)
+    vals = signal_values(times, ids)
+    # pyvcd drops changes that repeat the signal's previous value
+    mods = np.maximum(1, (ids + 1) // 10) if dense else ids + 1
+    changed = vals != signal_values(times - mods, ids)
+    if not changed.any():
+        return b""
+    return _format_vcd_block(
+        times[changed], ids[changed], vals[changed], ident_chars, ident_lens, ndigits
+    )
+
+
+def generate_vcd(path: str, num_signals: int, num_timesteps: int, jobs: int = 1) -> int:
     """Generate a synthetic VCD file.
 
+    pyvcd renders the header and ``$dumpvars`` section; the value changes
+    are computed and formatted block-wise with NumPy, producing output
+    identical to calling ``VCDWriter.change`` for every scheduled change.
+    Blocks are formatted by *jobs* worker processes and each reaches the
+    file as a single ``write``.
+
     Returns file size in bytes.
     """
+    import io
+
+    import numpy as np
     from vcd.writer import VCDWriter
 
     Path(path).parent.mkdir(parents=True, exist_ok=True)
 
-    with open(path, "w") as f:
-        with VCDWriter(f, timescale="1ns", date="benchmark") as writer:
-            signals = []
-            for i in range(num_signals):
-                if i % 3 == 0:
-                    size = 1       # 1-bit
-                elif i % 3 == 1:
-                    size = 8       # 8-bit
-                else:
-                    size = 32      # 32-bit
-                sig = writer.register_var(
-                    "bench", f"sig_{i:04d}", "wire", size=size, init=0
-                )
-                signals.append((sig, size))
-
-            # Use denser change pattern for larger files to reach target size.
-            # For signals with high index, reduce the modulus to increase activity.
-            dense = num_signals > 500
-            for t in range(num_timesteps):
-                timestamp = t * 10
-                for i, (sig, size) in enumerate(signals):
-                    mod = max(1, (i + 1) // 10) if dense else (i + 1)
-                    if t % mod == 0:
-                        if size == 1:
-                            value = t % 2
-                        else:
-                            value = (t * (i + 1)) % (2 ** size)
-                        writer.change(sig, timestamp, value)
+    dense = num_signals > 500
+    ndigits = len(str(max(num_timesteps - 1, 0) * 10))
+
+    with open(path, "wb", buffering=VCD_WRITE_BUFFER) as f:
+        # pyvcd's many small header writes are coalesced by the file buffer
+        text = io.TextIOWrapper(f, encoding="ascii", newline="\n", write_through=False)
+        writer = VCDWriter(text, timescale="1ns", date="benchmark")
+        idents = []
+        for i in range(num_signals):
+            sig = writer.register_var(
+                "bench", f"sig_{i:04d}", "wire", size=_signal_size(i), init=0
+            )
+            idents.append(sig.ident.encode("ascii"))
+        writer.close()
+        text.detach()
+
+        ident_width = max(len(ident) for ident in idents)
+        ident_chars = np.zeros((num_signals, ident_width), dtype=np.uint8)
+        for i, ident in enumerate(idents):
+            ident_chars[i, :len(ident)] = np.frombuffer(ident, dtype=np.uint8)
+        ident_lens = np.array([len(ident) for ident in idents], dtype=np.int64)
+
+        # t=0 only re-asserts the initial zeros, which pyvcd suppresses.
+        state = (num_signals, dense, ident_chars, ident_lens, ndigits)
+        blocks = _time_blocks(num_signals, num_timesteps, dense)
+        for text_block in _map_blocks(_vcd_block, blocks, jobs, _init_block_worker, state):
+            f.write(text_block)
 
     return Path(path).stat().st_size
 
@@ -105,14 +342,94 @@ def generate_vcd(path: str, num_signals: int, num_timesteps: int) -> int:
 # ---------------------------------------------------------------------------
 # FST generation (uses pylibfst C API via cffi)
 # ---------------------------------------------------------------------------
-def generate_fst(path: str, num_signals: int, num_timesteps: int) -> int:
+# Binary ASCII lookup tables for the Python FST loop: BITS8[v] == f"{v:08b}"
+BITS1 = (b"0", b"1")
+BITS8 = tuple(f"{i:08b}".encode("ascii") for i in range(256))
+# Initial value per signal size, emitted at time 0
+ZEROS = {size: b"0" * size for size in (1, 8, 32)}
+
+
+def _fst_block(block):
+    """Compute ``(times, ids, values)`` lists for ``t0 <= t < t1`` (block worker)."""
+    num_signals, dense = _BLOCK_STATE
+    times, ids = build_schedule(num_signals, block[0], block[1], dense)
+    return times.tolist(), ids.tolist(), signal_values(times, ids).tolist()
+
+
+def _emit_fst_python(lib, ctx, handles, num_timesteps: int, dense: bool, jobs: int = 1) -> None:
+    """Fallback value-change loop, one pylibfst call per change.
+
+    The schedule is computed block-wise by *jobs* worker processes; the FST
+    context is not reentrant, so all emit calls stay in this process.
+    """
+    # Initial values at time 0
+    lib.fstWriterEmitTimeChange(ctx, 0)
+    for handle, size in handles:
+        lib.fstWriterEmitValueChange(ctx, handle, ZEROS[size])
+
+    blocks = _time_blocks(len(handles), num_timesteps, dense)
+    last_t = 0
+    for times, ids, vals in _map_blocks(
+        _fst_block, blocks, jobs, _init_block_worker, (len(handles), dense)
+    ):
+        for t, i, int_val in zip(times, ids, vals):
+            if t != last_t:
+                lib.fstWriterEmitTimeChange(ctx, t * 10)
+                last_t = t
+            handle, size = handles[i]
+            if size == 1:
+                value = BITS1[int_val]
+            elif size == 8:
+                value = BITS8[int_val]
+            else:
+                b = int_val.to_bytes(4, "big")
+                value = BITS8[b[0]] + BITS8[b[1]] + BITS8[b[2]] + BITS8[b[3]]
+            lib.fstWriterEmitValueChange(ctx, handle, value)
+
+
+def _emit_fst_native(ffi, lib, ctx, handles, num_timesteps: int, dense: bool) -> None:
+    """Run the whole value-change loop in C via the ``_fstgen`` helper.
+
+    The writer context and pylibfst's ``fstWriterEmit*`` entry points are
+    handed over as raw addresses, so each change is a native C call.
+    """
+    import _fstgen
+
+    gffi = _fstgen.ffi
+
+    def as_ptr(ctype, cdata):
+        return gffi.cast(ctype, int(ffi.cast("uintptr_t", cdata)))
+
+    _fstgen.lib.fstgen_generate(
+        as_ptr("void *", ctx),
+        as_ptr("fstgen_emit_time_fn", ffi.addressof(lib, "fstWriterEmitTimeChange")),
+        as_ptr("fstgen_emit_value_fn", ffi.addressof(lib, "fstWriterEmitValueChange")),
+        gffi.new("uint32_t[]", [handle for handle, _ in handles]),
+        gffi.new("uint32_t[]", [size for _, size in handles]),
+        len(handles),
+        num_timesteps,
+        dense,
+    )
+
+
+def generate_fst(path: str, num_signals: int, num_timesteps: int, jobs: int = 1) -> int:
     """Generate a synthetic FST file.
 
+    Uses the compiled ``_fstgen`` helper (see fstgen_build.py) for the
+    value-change loop when available, else falls back to Python with the
+    schedule computed by *jobs* worker processes.
+
     Returns file size in bytes.
     """
     import pylibfst
     from pylibfst import lib, ffi
 
+    try:
+        import _fstgen  # noqa: F401
+        native = True
+    except ImportError:
+        native = False
+
     Path(path).parent.mkdir(parents=True, exist_ok=True)
 
     ctx = lib.fstWriterCreate(path.encode("utf-8"), 1)
@@ -125,12 +442,7 @@ def generate_fst(path: str, num_signals: int, num_timesteps: int) -> int:
 
         handles = []
         for i in range(num_signals):
-            if i % 3 == 0:
-                size = 1
-            elif i % 3 == 1:
-                size = 8
-            else:
-                size = 32
+            size = _signal_size(i)
             name = f"sig_{i:04d}".encode("utf-8")
             handle = lib.fstWriterCreateVar(
                 ctx, lib.FST_VT_VCD_WIRE, lib.FST_VD_IMPLICIT, size, name, 0
@@ -139,25 +451,12 @@ def generate_fst(path: str, num_signals: int, num_timesteps: int) -> int:
 
         lib.fstWriterSetUpscope(ctx)
 
-        # Initial values at time 0
-        lib.fstWriterEmitTimeChange(ctx, 0)
-        for handle, size in handles:
-            lib.fstWriterEmitValueChange(ctx, handle, ("0" * size).encode("utf-8"))
-
         # Value changes (dense pattern for large files)
         dense = num_signals > 500
-        for t in range(1, num_timesteps):
-            timestamp = t * 10
-            lib.fstWriterEmitTimeChange(ctx, timestamp)
-            for i, (handle, size) in enumerate(handles):
-                mod = max(1, (i + 1) // 10) if dense else (i + 1)
-                if t % mod == 0:
-                    if size == 1:
-                        value = str(t % 2)
-                    else:
-                        int_val = (t * (i + 1)) % (2 ** size)
-                        value = format(int_val, f"0{size}b")
-                    lib.fstWriterEmitValueChange(ctx, handle, value.encode("utf-8"))
+        if native:
+            _emit_fst_native(ffi, lib, ctx, handles, num_timesteps, dense)
+        else:
+            _emit_fst_python(lib, ctx, handles, num_timesteps, dense, jobs)
     finally:
         lib.fstWriterClose(ctx)
 
@@ -172,14 +471,18 @@ def symlink_real_world(data_dir: Path) -> None:
     print("\nSymlinking real-world files...")
     for link_name, target in REAL_WORLD_FILES.items():
         link_path = data_dir / link_name
-        if link_path.exists() or link_path.is_symlink():
+        # One lstat/stat each instead of exists() + is_symlink() + stat()
+        try:
             link_path.unlink()
-        if target.exists():
-            link_path.symlink_to(target)
-            size = target.stat().st_size
-            print(f"  {link_name} -> {target.name}  ({format_size(size)})")
-        else:
+        except FileNotFoundError:
+            pass
+        try:
+            size = os.stat(target).st_size
+        except FileNotFoundError:
             print(f"  WARNING: {target} not found, skipping {link_name}")
+            continue
+        link_path.symlink_to(target)
+        print(f"  {link_name} -> {target.name}  ({format_size(size)})")
 
 
 # ---------------------------------------------------------------------------
@@ -191,9 +494,10 @@ def main() -> None:
     )
     parser.add_argument(
         "--scale",
+        nargs="+",
         choices=list(SCALE_CONFIG.keys()) + ["all"],
-        default="medium",
-        help="Data scale to generate (default: medium). Use 'all' for every scale.",
+        default=["medium"],
+        help="Data scale(s) to generate (default: medium). Use 'all' for every scale.",
     )
     parser.add_argument(
         "--data-dir",
@@ -201,17 +505,24 @@ def main() -> None:
         default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
         help="Output directory for generated files.",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes for value-change generation (default: all cores).",
+    )
     args = parser.parse_args()
 
     data_dir = Path(args.data_dir)
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    scales = list(SCALE_CONFIG.keys()) if args.scale == "all" else [args.scale]
+    scales = list(SCALE_CONFIG.keys()) if "all" in args.scale else list(dict.fromkeys(args.scale))
 
     print("=" * 60)
     print("Benchmark Test Data Generator")
     print(f"  Output directory : {data_dir}")
     print(f"  Scales           : {', '.join(scales)}")
+    print(f"  Jobs             : {args.jobs}")
     print("=" * 60)
 
     for scale in scales:
@@ -224,7 +535,7 @@ def main() -> None:
         vcd_path = str(data_dir / f"bench_{scale}.vcd")
         print(f"  Generating VCD ...", end=" ", flush=True)
         t0 = time.perf_counter()
-        vcd_size = generate_vcd(vcd_path, ns, nt)
+        vcd_size = generate_vcd(vcd_path, ns, nt, args.jobs)
         dt = time.perf_counter() - t0
         print(f"{format_size(vcd_size)} in {dt:.2f}s")
 
@@ -233,7 +544,7 @@ def main() -> None:
         print(f"  Generating FST ...", end=" ", flush=True)
         t0 = time.perf_counter()
         try:
-            fst_size = generate_fst(fst_path, ns, nt)
+            fst_size = generate_fst(fst_path, ns, nt, args.jobs)
             dt = time.perf_counter() - t0
             print(f"{format_size(fst_size)} in {dt:.2f}s")
         except Exception as e:
@@ -0,0 +1,195 @@
+"""Helpers shared by the Python benchmark scripts (bench_*.py).
+
+Imported as a sibling module: each script's own directory is on sys.path.
+"""
+
+import argparse
+import bisect
+import functools
+import gc
+import json
+import os
+import resource
+import select
+import signal
+import time
+
+
+def int_at_least(minimum):
+    """argparse type: an int that is at least *minimum*."""
+    def parse(text):
+        value = int(text)
+        if value < minimum:
+            raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {value}")
+        return value
+    parse.__name__ = "int"  # argparse names the type in "invalid int value" errors
+    return parse
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS watermark (VmHWM) to the current RSS.
+
+    Writing "5" to /proc/self/clear_refs needs Linux >= 4.0. Returns False
+    where that is unavailable.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5\n")
+        return True
+    except OSError:
+        return False
+
+
+def get_vm_hwm_kb():
+    """Return peak RSS (VmHWM) in KB from /proc/self/status, or None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def get_peak_rss_kb():
+    """Return peak RSS in KB, from VmHWM if available, else resource.getrusage."""
+    hwm = get_vm_hwm_kb()
+    if hwm is not None:
+        return hwm
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_maxrss
+
+
+def prefetch_file(path):
+    """Ask the kernel to read *path* into the page cache (no-op where unsupported)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def measure(test_func):
+    """Call test_func() once, return (elapsed_ns, peak_rss_kb)."""
+    gc.collect()
+    # After a reset VmHWM equals the current RSS, so the delta below is
+    # this test's own peak rather than a share of the process-lifetime one
+    reset_peak_rss()
+    rss_before = get_peak_rss_kb()
+    gc.disable()
+    try:
+        t0 = time.perf_counter_ns()
+        test_func()
+        t1 = time.perf_counter_ns()
+    finally:
+        gc.enable()
+    rss_after = get_peak_rss_kb()
+    return t1 - t0, max(rss_after - rss_before, 0)
+
+
+def measure_in_child(test_func, timeout_s):
+    """Run measure(test_func) in a forked child, return (elapsed_ns, peak_rss_kb) or raise.
+
+    Each call gets its own child (see run_in_child), so every repetition
+    starts from the same heap and its peak RSS is its own.
+    """
+    return tuple(run_in_child(functools.partial(measure, test_func), timeout_s))
+
+
+def drop_page_cache():
+    """Drop the kernel page cache (needs root; silently skipped otherwise)."""
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+    except OSError:
+        pass
+
+
+class TimeoutError(Exception):
+    pass
+
+
+def run_in_child(func, timeout_s):
+    """Call func() in a forked child and return its (JSON-serializable) result.
+
+    The parent waits on a pipe with select() against a deadline and kills
+    the child with SIGKILL once it passes, so the timeout holds even while
+    the child is inside Rust/C code where a signal would not be delivered.
+    TimeoutError is raised on timeout; an exception in the child is
+    re-raised here as RuntimeError with the same message. Without os.fork,
+    func() runs in this process with no timeout.
+    """
+    if not hasattr(os, "fork"):
+        return func()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = {"result": func()}
+        except BaseException as e:
+            payload = {"error": str(e)}
+        os.write(write_fd, json.dumps(payload).encode("utf-8"))
+        os._exit(0)
+
+    os.close(write_fd)
+    deadline = time.monotonic() + timeout_s
+    chunks = []
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([read_fd], [], [], remaining)[0]:
+                os.kill(pid, signal.SIGKILL)
+                raise TimeoutError("Test timed out")
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+
+    if not chunks:
+        raise RuntimeError(f"Test process died (wait status {status})")
+    payload = json.loads(b"".join(chunks))
+    if "error" in payload:
+        raise RuntimeError(payload["error"])
+    return payload["result"]
+
+
+def query_timing(cold):
+    """How the setup + query tests were timed, for the output document's "query_timing"."""
+    if cold:
+        return ("setup + query, timed together on every repetition after dropping "
+                "the page cache (BENCH_COLD=1; the drop needs root)")
+    return "query only; the file is opened and parsed once per file as untimed setup"
+
+
+def setup_then(setup, func, filepath):
+    """func(setup(filepath)): a setup + query test timed as one call."""
+    return func(setup(filepath))
+
+
+def discard(_state):
+    return None
+
+
+def pick_indices(n, k=3):
+    """Indices of up to *k* items spread evenly over a list of length *n*."""
+    k = min(k, n)
+    return [i * n // k for i in range(k)]
+
+
+def change_times(changes):
+    """Return the times of an iterable of ``(time, value)`` changes as a list (one pass)."""
+    return [t for t, _v in changes]
+
+
+def count_in_range(times, t_start, t_end):
+    """Number of entries of sorted *times* with ``t_start <= t <= t_end``."""
+    return bisect.bisect_right(times, t_end) - bisect.bisect_left(times, t_start)
@@ -0,0 +1,47 @@
+/*
+ * _fstcount.c -- native value-change counter for bench_pylibfst.py.
+ *
+ * Compiled into the `_fstcount` cffi module by fstcount_build.py. The
+ * reader's fstReaderIterBlocks is passed in as a function pointer taken
+ * from pylibfst's own cffi module, so this file does not link against
+ * libfst and no Python code runs per value change.
+ */
+
+#include <stdint.h>
+
+typedef void (*fstcount_vc_fn)(void *user, uint64_t time, uint32_t facidx,
+                               const unsigned char *value);
+typedef int (*fstcount_iter_blocks_fn)(void *ctx, fstcount_vc_fn cb,
+                                       void *user, void *vcdhandle);
+
+struct count_state {
+    uint64_t t_end;
+    uint64_t *counters;
+    uint32_t num_counters;
+};
+
+static void count_cb(void *user, uint64_t time, uint32_t facidx,
+                     const unsigned char *value)
+{
+    struct count_state *s = user;
+
+    (void)value;
+    if (time <= s->t_end && facidx < s->num_counters)
+        s->counters[facidx]++;
+}
+
+/*
+ * Iterate all value changes selected by the fac process mask and bump
+ * counters[facidx] for each one at or before t_end.
+ */
+int fstcount_iter_blocks(fstcount_iter_blocks_fn iter_blocks, void *ctx,
+                         uint64_t t_end, uint64_t *counters,
+                         uint32_t num_counters)
+{
+    struct count_state s;
+
+    s.t_end = t_end;
+    s.counters = counters;
+    s.num_counters = num_counters;
+    return iter_blocks(ctx, count_cb, &s, 0);
+}
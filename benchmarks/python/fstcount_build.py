@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Build the optional ``_fstcount`` cffi module used by bench_pylibfst.py.
+
+The module counts FST value changes in C (see _fstcount.c). When it is not
+built, the value-query tests fall back to a Python callback.
+
+Usage:
+    python fstcount_build.py    # writes _fstcount.*.so next to this script
+"""
+
+import os
+
+from cffi import FFI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ffibuilder = FFI()
+ffibuilder.cdef(
+    """
+    typedef void (*fstcount_vc_fn)(void *user, uint64_t time, uint32_t facidx,
+                                   const unsigned char *value);
+    typedef int (*fstcount_iter_blocks_fn)(void *ctx, fstcount_vc_fn cb,
+                                           void *user, void *vcdhandle);
+
+    int fstcount_iter_blocks(fstcount_iter_blocks_fn iter_blocks, void *ctx,
+                             uint64_t t_end, uint64_t *counters,
+                             uint32_t num_counters);
+"""
+)
+
+with open(os.path.join(HERE, "_fstcount.c")) as fp:
+    ffibuilder.set_source("_fstcount", fp.read(), extra_compile_args=["-O3"])
+
+if __name__ == "__main__":
+    # Build in a scratch dir so cffi's generated _fstcount.c does not overwrite ours
+    ffibuilder.compile(
+        tmpdir=os.path.join(HERE, "build"),
+        target=os.path.join(HERE, "_fstcount.*"),
+        verbose=True,
+    )
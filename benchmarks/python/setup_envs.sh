@@ -2,8 +2,8 @@
 # setup_envs.sh -- Create isolated Python virtual environments for benchmarking.
 #
 # Creates three uv-managed venvs under benchmarks/python/:
-#   .venv_vcdvcd   -- vcdvcd (VCD reader) + pyvcd (VCD writer)
-#   .venv_pylibfst -- pylibfst (FST reader/writer via C API)
+#   .venv_vcdvcd   -- vcdvcd (VCD reader) + pyvcd (VCD writer) + numpy
+#   .venv_pylibfst -- pylibfst (FST reader/writer via C API) + pyvcd + numpy
 #   .venv_pywellen -- pywellen (Rust-based waveform parser via maturin)
 #
 # Usage:
@@ -36,18 +36,25 @@ echo ""
 echo "--- [1/3] Creating .venv_vcdvcd (vcdvcd + pyvcd) ---"
 VENV_VCDVCD="${SCRIPT_DIR}/.venv_vcdvcd"
 uv venv "${VENV_VCDVCD}"
-uv pip install --python "${VENV_VCDVCD}/bin/python" vcdvcd pyvcd
-echo "  Installed vcdvcd + pyvcd into ${VENV_VCDVCD}"
+uv pip install --python "${VENV_VCDVCD}/bin/python" vcdvcd pyvcd numpy
+echo "  Installed vcdvcd + pyvcd + numpy into ${VENV_VCDVCD}"
 
 # ---------------------------------------------------------------------------
 # 2. pylibfst
 # ---------------------------------------------------------------------------
 echo ""
-echo "--- [2/3] Creating .venv_pylibfst (pylibfst) ---"
+echo "--- [2/3] Creating .venv_pylibfst (pylibfst + data generation deps) ---"
 VENV_PYLIBFST="${SCRIPT_DIR}/.venv_pylibfst"
 uv venv "${VENV_PYLIBFST}"
-uv pip install --python "${VENV_PYLIBFST}/bin/python" pylibfst
-echo "  Installed pylibfst into ${VENV_PYLIBFST}"
+# pyvcd + numpy let this venv generate both VCD and FST test data
+uv pip install --python "${VENV_PYLIBFST}/bin/python" pylibfst pyvcd numpy
+echo "  Installed pylibfst + pyvcd + numpy into ${VENV_PYLIBFST}"
+"${VENV_PYLIBFST}/bin/python" "${SCRIPT_DIR}/../fstgen_build.py" >/dev/null || {
+    echo "  WARNING: _fstgen build failed. FST data generation will use the Python loop."
+}
+"${VENV_PYLIBFST}/bin/python" "${SCRIPT_DIR}/fstcount_build.py" >/dev/null || {
+    echo "  WARNING: _fstcount build failed. pylibfst value queries will use a Python callback."
+}
 
 # ---------------------------------------------------------------------------
 # 3. pywellen (Rust, built via maturin)
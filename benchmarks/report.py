@@ -9,11 +9,28 @@ Usage:
 """
 
 import argparse
+import concurrent.futures
+import functools
+import itertools
 import json
+import mmap
+import operator
 import os
 import sys
 import time
 from pathlib import Path
+from sys import intern
+from typing import NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
 
 
 def log(msg):
@@ -26,97 +43,195 @@ def load_combined(results_dir, scale):
     if not path.exists():
         log(f"Combined results not found: {path}")
         return None
-    with open(path) as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # an empty file cannot be mapped
+            return _loads(f.read())
+    # Parse straight from the mapping instead of copying the file into a bytes
+    with mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mm) as view:
+            return _loads(view)
+
+
+def _loads(data):
+    """Decode a JSON bytes-like object with orjson, else pysimdjson, else the stdlib."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN/Infinity, which only the stdlib parser accepts
+    elif simdjson is not None:
+        try:
+            # recursive=True builds plain dicts/lists; normalize_results reads
+            # every field of every record, so lazy element views buy nothing
+            return simdjson.Parser().parse(data, True)
+        except ValueError:
+            pass
+    return json.loads(bytes(data))  # the stdlib takes no memoryview
+
+
+TEST_CATEGORIES = ("full_parse", "signal_list", "value_query", "pipeline")
+
+
+@functools.lru_cache(maxsize=None)
+def categorize_test(test):
+    """The TEST_CATEGORIES entry contained in a test name, or "other"."""
+    for cat in TEST_CATEGORIES:
+        if cat in test:
+            return cat
+    return "other"
+
+
+class Record(NamedTuple):
+    """One normalized benchmark result (a Python or Rust test on one file).
+
+    The low-cardinality string fields (library, format, file, test, status)
+    are interned, so equal values share one object across records.
+    """
+    library: str
+    language: str
+    format: str
+    file: str
+    test: str
+    mean_s: float
+    stdev_s: float
+    memory_kb: int
+    status: str
+    error: str
+    file_size_bytes: int
+    times_s: list
+    category: str  # categorize_test(test)
+    scale: str = ""
+
+
+def _summary_record(library, language, fmt, r, scale):
+    """Record from a harness summary entry ({test, file, mean_s, stdev_s, ...})."""
+    test = r.get("test", "")
+    return Record(
+        library=intern(library),
+        language=language,
+        format=intern(fmt),
+        file=intern(r.get("file", "")),
+        test=intern(test),
+        mean_s=r.get("mean_s", 0),
+        stdev_s=r.get("stdev_s", 0),
+        memory_kb=r.get("memory_kb", 0),
+        status=intern(r.get("status", "unknown")),
+        error=r.get("error", ""),
+        file_size_bytes=r.get("file_size_bytes", 0),
+        times_s=r.get("times_s", []),
+        category=categorize_test(test),
+        scale=scale,
+    )
 
 
-def normalize_results(combined):
-    """Normalize Python and Rust results into a unified list of records.
+def _file_size(path):
+    """Size of *path* in bytes, or 0 if it cannot be stat'd."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
 
-    Each record: {library, format, file, test, mean_s, stdev_s, memory_kb, status, error, file_size_bytes}
+def _rust_file_info(flat_results):
+    """{file path: (basename, size)} for the files named by flat Rust results.
+
+    The same file appears in every test run against it, so each path is
+    split and stat'd once here rather than per record.
     """
-    records = []
+    paths = {r.get("file") for r in flat_results}
+    # Estimate file size from path
+    return {p: (intern(os.path.basename(p)), _file_size(p)) for p in paths if p}
+
+
+def _rust_record(r, scale, file_info):
+    """Record from a flat Rust BenchResult ({library, format, file, operation, mean, ...})."""
+    file_name, file_size = file_info.get(r.get("file", ""), ("", 0))
+    test = r.get("operation", "")
+    return Record(
+        library=intern(r.get("library", "unknown")),
+        language="Rust",
+        format=intern(r.get("format", "unknown")),
+        file=file_name,
+        test=intern(test),
+        mean_s=r.get("mean", 0),
+        stdev_s=r.get("stdev", 0),
+        memory_kb=r.get("peak_memory_kb", 0),
+        status=intern(r.get("status", "unknown")),
+        error=r.get("error", ""),
+        file_size_bytes=file_size,
+        times_s=r.get("times", []),
+        category=categorize_test(test),
+        scale=scale,
+    )
 
+
+def _rust_records(r, scale, file_info):
+    """Records from one rust_results entry, which is flat or wrapped."""
+    # Rust results may be a flat list of BenchResult objects
+    if isinstance(r, dict) and "operation" in r:
+        return [_rust_record(r, scale, file_info)]
+    if isinstance(r, dict) and "results" in r:
+        # Wrapped format (from error cases)
+        library = r.get("library", "unknown")
+        fmt = r.get("format", "unknown")
+        return [_summary_record(library, "Rust", fmt, sub, scale) for sub in r.get("results", [])]
+    return []
+
+
+def normalize_results(combined, scale=""):
+    """Normalize Python and Rust results into a unified list of Records, tagged with *scale*."""
     # Python results: list of {library, format, results: [{test, scale, file, ...}]}
-    for lib_data in combined.get("python_results", []):
-        library = lib_data.get("library", "unknown")
-        fmt = lib_data.get("format", "unknown")
-        for r in lib_data.get("results", []):
-            records.append({
-                "library": library,
-                "language": "Python",
-                "format": fmt,
-                "file": r.get("file", ""),
-                "test": r.get("test", ""),
-                "mean_s": r.get("mean_s", 0),
-                "stdev_s": r.get("stdev_s", 0),
-                "memory_kb": r.get("memory_kb", 0),
-                "status": r.get("status", "unknown"),
-                "error": r.get("error", ""),
-                "file_size_bytes": r.get("file_size_bytes", 0),
-                "times_s": r.get("times_s", []),
-            })
+    records = [
+        _summary_record(lib_data.get("library", "unknown"), "Python", lib_data.get("format", "unknown"), r, scale)
+        for lib_data in combined.get("python_results", [])
+        for r in lib_data.get("results", [])
+    ]
 
     # Rust results: list of {library, format, file, operation, mean, ...}
-    for r in combined.get("rust_results", []):
-        # Rust results may be a flat list of BenchResult objects
-        if isinstance(r, dict) and "operation" in r:
-            file_path = r.get("file", "")
-            file_name = os.path.basename(file_path) if file_path else ""
-            # Estimate file size from path
-            file_size = 0
-            if file_path and os.path.exists(file_path):
-                try:
-                    file_size = os.path.getsize(file_path)
-                except OSError:
-                    pass
-            records.append({
-                "library": r.get("library", "unknown"),
-                "language": "Rust",
-                "format": r.get("format", "unknown"),
-                "file": file_name,
-                "test": r.get("operation", ""),
-                "mean_s": r.get("mean", 0),
-                "stdev_s": r.get("stdev", 0),
-                "memory_kb": r.get("peak_memory_kb", 0),
-                "status": r.get("status", "unknown"),
-                "error": r.get("error", ""),
-                "file_size_bytes": file_size,
-                "times_s": r.get("times", []),
-            })
-        elif isinstance(r, dict) and "results" in r:
-            # Wrapped format (from error cases)
-            library = r.get("library", "unknown")
-            for sub in r.get("results", []):
-                records.append({
-                    "library": library,
-                    "language": "Rust",
-                    "format": r.get("format", "unknown"),
-                    "file": sub.get("file", ""),
-                    "test": sub.get("test", ""),
-                    "mean_s": sub.get("mean_s", 0),
-                    "stdev_s": sub.get("stdev_s", 0),
-                    "memory_kb": sub.get("memory_kb", 0),
-                    "status": sub.get("status", "unknown"),
-                    "error": sub.get("error", ""),
-                    "file_size_bytes": sub.get("file_size_bytes", 0),
-                    "times_s": sub.get("times_s", []),
-                })
+    rust_results = combined.get("rust_results", [])
+    flat = [r for r in rust_results if isinstance(r, dict) and "operation" in r]
+    file_info = _rust_file_info(flat)
+    if len(flat) == len(rust_results):
+        # The usual case: every entry is a flat BenchResult
+        records += [_rust_record(r, scale, file_info) for r in flat]
+    else:
+        # Wrapped error entries are mixed in; dispatch each to keep input order
+        records += [rec for r in rust_results for rec in _rust_records(r, scale, file_info)]
 
     return records
 
 
+# (upper bound in seconds, multiplier, format spec, unit) for format_time
+_TIME_UNITS = (
+    (0.001, 1_000_000, ".1f", "us"),
+    (1, 1000, ".2f", "ms"),
+)
+
+# _BARS[n] is a bar of n "#", up to the default ascii_bar width; wider bars are built on demand
+_BARS = tuple("#" * n for n in range(31))
+
+# Markdown table rows and bar chart lines, formatted from positional cells
+_ROW4 = "| {} | {} | {} | {} |".format
+_ROW6 = "| {} | {} | {} | {} | {} | {} |".format
+_BAR_LINE = "  {:15s} |{}| {}".format
+
+
+@functools.lru_cache(maxsize=4096)
 def format_time(seconds):
     """Format time to human-readable string."""
     if seconds <= 0:
         return "N/A"
-    if seconds < 0.001:
-        return f"{seconds * 1_000_000:.1f}us"
-    if seconds < 1:
-        return f"{seconds * 1000:.2f}ms"
+    for limit, scale, spec, unit in _TIME_UNITS:
+        if seconds < limit:
+            return f"{seconds * scale:{spec}}{unit}"
     return f"{seconds:.3f}s"
 
 
+@functools.lru_cache(maxsize=4096)
 def format_size(size_bytes):
     """Format bytes to human-readable."""
     if size_bytes <= 0:
@@ -141,229 +256,271 @@ def ascii_bar(value, max_value, width=30):
         return ""
     bar_len = int((value / max_value) * width)
     bar_len = max(1, min(bar_len, width))
-    return "#" * bar_len
+    return _BARS[bar_len] if bar_len < len(_BARS) else "#" * bar_len
 
 
-def generate_report(records, scale, output_path):
-    """Generate a Markdown report from normalized records."""
-    lines = []
-    lines.append("# VCD/FST Library Benchmark Report\n")
-    lines.append(f"- **Scale**: {scale}")
-    lines.append(f"- **Date**: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append(f"- **Total benchmarks**: {len(records)}")
+def _report_order(r):
+    """Sort key for report tables: category, file, then fastest first (no time last)."""
+    return (r.category, r.file, r.mean_s if r.mean_s > 0 else 9999)
+
 
-    ok_records = [r for r in records if r["status"] == "ok"]
-    err_records = [r for r in records if r["status"] != "ok"]
-    lines.append(f"- **Passed**: {len(ok_records)}, **Failed/Skipped**: {len(err_records)}")
-    lines.append("")
+def bucket_records(records):
+    """Group records by test category and file with one sort.
+
+    Returns {category: {file: bucket}} in file order, where each bucket is
+    {"records": [...] fastest first, "file_size": max file_size_bytes,
+    "max_time": max positive mean_s}. Records of category "other" are dropped;
+    those without a file are kept under "".
+    """
+    buckets = {cat: {} for cat in TEST_CATEGORIES}
+    ordered = sorted(records, key=_report_order)
+    for (cat, f), group in itertools.groupby(ordered, key=operator.attrgetter("category", "file")):
+        by_file = buckets.get(cat)
+        if by_file is None:
+            continue
+        recs = list(group)
+        by_file[f] = {
+            "records": recs,
+            "file_size": max(r.file_size_bytes for r in recs),
+            "max_time": max((r.mean_s for r in recs if r.mean_s > 0), default=0),
+        }
+    return buckets
+
+
+def rank_libraries(records):
+    """Average positive mean_s per "library (language)", fastest first.
+
+    Returns [(label, avg_s, count)]; libraries without a positive time are left out.
+    """
+    lib_ids = {}
+    ids = []
+    means = []
+    for r in records:
+        i = lib_ids.setdefault(f"{r.library} ({r.language})", len(lib_ids))
+        if r.mean_s > 0:
+            ids.append(i)
+            means.append(r.mean_s)
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        counts = np.bincount(ids, minlength=len(lib_ids)).tolist()
+        sums = np.bincount(ids, weights=means, minlength=len(lib_ids)).tolist()
+    else:
+        counts = [0] * len(lib_ids)
+        sums = [0.0] * len(lib_ids)
+        for i, m in zip(ids, means):
+            counts[i] += 1
+            sums[i] += m
+
+    ranking = [(lib, sums[i] / counts[i], counts[i]) for lib, i in lib_ids.items() if counts[i]]
+    ranking.sort(key=lambda x: x[1])
+    return ranking
+
+
+def write_report(out, records, scale):
+    """Write the Markdown report for normalized records to text file *out* as it is built."""
+    def emit(line):
+        out.write(line)
+        out.write("\n")
+
+    def emit_lines(block):
+        # A table body or bar chart in a single write
+        out.write("\n".join(block))
+        out.write("\n")
+
+    emit("# VCD/FST Library Benchmark Report\n")
+    emit(f"- **Scale**: {scale}")
+    emit(f"- **Date**: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    emit(f"- **Total benchmarks**: {len(records)}")
+
+    ok_records = [r for r in records if r.status == "ok"]
+    err_records = [r for r in records if r.status != "ok"]
+    emit(f"- **Passed**: {len(ok_records)}, **Failed/Skipped**: {len(err_records)}")
+    emit("")
+
+    buckets = bucket_records(ok_records)
+    # Per category, the (file, bucket) pairs that get a table, in file order;
+    # records without a file name only count towards the Section 5 ranking
+    tables = {cat: [(f, b) for f, b in by_file.items() if f] for cat, by_file in buckets.items()}
 
     # ----- Section 1: Full Parse Comparison -----
-    lines.append("## 1. Full Parse Performance\n")
-    parse_records = [r for r in ok_records if "full_parse" in r["test"]]
-
-    if parse_records:
-        # Group by file
-        files = sorted(set(r["file"] for r in parse_records if r["file"]))
-        for f in files:
-            file_records = [r for r in parse_records if r["file"] == f]
-            if not file_records:
-                continue
-            file_size = max(r["file_size_bytes"] for r in file_records)
-            lines.append(f"### File: `{f}` ({format_size(file_size)})\n")
-            lines.append("| Library | Language | Format | Time | Throughput | Memory |")
-            lines.append("|---------|----------|--------|------|------------|--------|")
-
-            sorted_recs = sorted(file_records, key=lambda r: r["mean_s"] if r["mean_s"] > 0 else 9999)
-            for r in sorted_recs:
-                tp = throughput_mbs(r["file_size_bytes"], r["mean_s"])
+    emit("## 1. Full Parse Performance\n")
+    parse_buckets = buckets["full_parse"]
+
+    if parse_buckets:
+        for f, bucket in tables["full_parse"]:
+            file_size = bucket["file_size"]
+            emit(f"### File: `{f}` ({format_size(file_size)})\n")
+            emit("| Library | Language | Format | Time | Throughput | Memory |")
+            emit("|---------|----------|--------|------|------------|--------|")
+
+            # Table rows and bar lines in one pass; bars are emitted after the table
+            max_time = bucket["max_time"]
+            rows = []
+            bar_lines = []
+            for r in bucket["records"]:
+                time_str = format_time(r.mean_s)
+                bar_lines.append(_BAR_LINE(r.library, ascii_bar(r.mean_s, max_time), time_str))
+                tp = throughput_mbs(r.file_size_bytes, r.mean_s)
                 tp_str = f"{tp:.1f} MB/s" if tp > 0 else "N/A"
-                mem_str = f"{r['memory_kb']}KB" if r["memory_kb"] > 0 else "N/A"
-                lines.append(
-                    f"| {r['library']} | {r['language']} | {r['format']} | "
-                    f"{format_time(r['mean_s'])} | {tp_str} | {mem_str} |"
-                )
-            lines.append("")
+                mem_str = f"{r.memory_kb}KB" if r.memory_kb > 0 else "N/A"
+                rows.append(_ROW6(r.library, r.language, r.format, time_str, tp_str, mem_str))
+            emit_lines(rows)
+            emit("")
 
             # ASCII bar chart
-            if len(sorted_recs) > 1:
-                max_time = max(r["mean_s"] for r in sorted_recs if r["mean_s"] > 0)
-                lines.append("```")
-                for r in sorted_recs:
-                    bar = ascii_bar(r["mean_s"], max_time)
-                    lines.append(f"  {r['library']:15s} |{bar}| {format_time(r['mean_s'])}")
-                lines.append("```")
-                lines.append("")
+            if len(bar_lines) > 1:
+                emit("```")
+                emit_lines(bar_lines)
+                emit("```")
+                emit("")
 
     # ----- Section 2: Signal List Performance -----
-    lines.append("## 2. Signal List Retrieval Performance\n")
-    sig_records = [r for r in ok_records if "signal_list" in r["test"]]
-
-    if sig_records:
-        files = sorted(set(r["file"] for r in sig_records if r["file"]))
-        for f in files:
-            file_records = [r for r in sig_records if r["file"] == f]
-            if not file_records:
-                continue
-            lines.append(f"### File: `{f}`\n")
-            lines.append("| Library | Language | Time | Stdev |")
-            lines.append("|---------|----------|------|-------|")
-            sorted_recs = sorted(file_records, key=lambda r: r["mean_s"] if r["mean_s"] > 0 else 9999)
-            for r in sorted_recs:
-                lines.append(
-                    f"| {r['library']} | {r['language']} | "
-                    f"{format_time(r['mean_s'])} | {format_time(r['stdev_s'])} |"
-                )
-            lines.append("")
+    emit("## 2. Signal List Retrieval Performance\n")
+    sig_buckets = buckets["signal_list"]
+
+    if sig_buckets:
+        for f, bucket in tables["signal_list"]:
+            emit(f"### File: `{f}`\n")
+            emit("| Library | Language | Time | Stdev |")
+            emit("|---------|----------|------|-------|")
+            emit_lines([
+                _ROW4(r.library, r.language, format_time(r.mean_s), format_time(r.stdev_s))
+                for r in bucket["records"]
+            ])
+            emit("")
 
     # ----- Section 3: Value Query Performance -----
-    lines.append("## 3. Value Query Performance\n")
-    val_records = [r for r in ok_records if "value_query" in r["test"]]
-
-    if val_records:
-        files = sorted(set(r["file"] for r in val_records if r["file"]))
-        for f in files:
-            file_records = [r for r in val_records if r["file"] == f]
-            if not file_records:
-                continue
-            file_size = max(r["file_size_bytes"] for r in file_records)
-            lines.append(f"### File: `{f}` ({format_size(file_size)})\n")
-            lines.append("| Library | Language | Format | Time | Stdev | Memory |")
-            lines.append("|---------|----------|--------|------|-------|--------|")
-            sorted_recs = sorted(file_records, key=lambda r: r["mean_s"] if r["mean_s"] > 0 else 9999)
-            for r in sorted_recs:
-                mem_str = f"{r['memory_kb']}KB" if r["memory_kb"] > 0 else "N/A"
-                lines.append(
-                    f"| {r['library']} | {r['language']} | {r['format']} | "
-                    f"{format_time(r['mean_s'])} | {format_time(r['stdev_s'])} | {mem_str} |"
-                )
-            lines.append("")
+    emit("## 3. Value Query Performance\n")
+    val_buckets = buckets["value_query"]
+
+    if val_buckets:
+        for f, bucket in tables["value_query"]:
+            file_size = bucket["file_size"]
+            emit(f"### File: `{f}` ({format_size(file_size)})\n")
+            emit("| Library | Language | Format | Time | Stdev | Memory |")
+            emit("|---------|----------|--------|------|-------|--------|")
+            # Table rows and bar lines in one pass; bars are emitted after the table
+            max_time = bucket["max_time"]
+            rows = []
+            bar_lines = []
+            for r in bucket["records"]:
+                time_str = format_time(r.mean_s)
+                bar_lines.append(_BAR_LINE(r.library, ascii_bar(r.mean_s, max_time), time_str))
+                mem_str = f"{r.memory_kb}KB" if r.memory_kb > 0 else "N/A"
+                rows.append(_ROW6(r.library, r.language, r.format, time_str, format_time(r.stdev_s), mem_str))
+            emit_lines(rows)
+            emit("")
 
             # ASCII bar chart
-            if len(sorted_recs) > 1:
-                max_time = max(r["mean_s"] for r in sorted_recs if r["mean_s"] > 0)
-                lines.append("```")
-                for r in sorted_recs:
-                    bar = ascii_bar(r["mean_s"], max_time)
-                    lines.append(f"  {r['library']:15s} |{bar}| {format_time(r['mean_s'])}")
-                lines.append("```")
-                lines.append("")
+            if len(bar_lines) > 1:
+                emit("```")
+                emit_lines(bar_lines)
+                emit("```")
+                emit("")
 
     # ----- Section 4: Pipeline (Continuous Operation) Performance -----
-    lines.append("## 4. Pipeline Performance (Load + Signal List + Time Range + Value Query)\n")
-    pipe_records = [r for r in ok_records if "pipeline" in r["test"]]
-
-    if pipe_records:
-        files = sorted(set(r["file"] for r in pipe_records if r["file"]))
-        for f in files:
-            file_records = [r for r in pipe_records if r["file"] == f]
-            if not file_records:
-                continue
-            file_size = max(r["file_size_bytes"] for r in file_records)
-            lines.append(f"### File: `{f}` ({format_size(file_size)})\n")
-            lines.append("| Library | Language | Format | Pipeline Time | Throughput | Memory |")
-            lines.append("|---------|----------|--------|---------------|------------|--------|")
-
-            sorted_recs = sorted(file_records, key=lambda r: r["mean_s"] if r["mean_s"] > 0 else 9999)
-            for r in sorted_recs:
-                tp = throughput_mbs(r["file_size_bytes"], r["mean_s"])
+    emit("## 4. Pipeline Performance (Load + Signal List + Time Range + Value Query)\n")
+    pipe_buckets = buckets["pipeline"]
+
+    if pipe_buckets:
+        for f, bucket in tables["pipeline"]:
+            file_size = bucket["file_size"]
+            emit(f"### File: `{f}` ({format_size(file_size)})\n")
+            emit("| Library | Language | Format | Pipeline Time | Throughput | Memory |")
+            emit("|---------|----------|--------|---------------|------------|--------|")
+
+            # Table rows and bar lines in one pass; bars are emitted after the table
+            max_time = bucket["max_time"]
+            rows = []
+            bar_lines = []
+            for r in bucket["records"]:
+                time_str = format_time(r.mean_s)
+                bar_lines.append(_BAR_LINE(r.library, ascii_bar(r.mean_s, max_time), time_str))
+                tp = throughput_mbs(r.file_size_bytes, r.mean_s)
                 tp_str = f"{tp:.1f} MB/s" if tp > 0 else "N/A"
-                mem_str = f"{r['memory_kb']}KB" if r["memory_kb"] > 0 else "N/A"
-                lines.append(
-                    f"| {r['library']} | {r['language']} | {r['format']} | "
-                    f"{format_time(r['mean_s'])} | {tp_str} | {mem_str} |"
-                )
-            lines.append("")
+                mem_str = f"{r.memory_kb}KB" if r.memory_kb > 0 else "N/A"
+                rows.append(_ROW6(r.library, r.language, r.format, time_str, tp_str, mem_str))
+            emit_lines(rows)
+            emit("")
 
             # ASCII bar chart
-            if len(sorted_recs) > 1:
-                max_time = max(r["mean_s"] for r in sorted_recs if r["mean_s"] > 0)
-                lines.append("```")
-                for r in sorted_recs:
-                    bar = ascii_bar(r["mean_s"], max_time)
-                    lines.append(f"  {r['library']:15s} |{bar}| {format_time(r['mean_s'])}")
-                lines.append("```")
-                lines.append("")
+            if len(bar_lines) > 1:
+                emit("```")
+                emit_lines(bar_lines)
+                emit("```")
+                emit("")
     else:
-        lines.append("No pipeline benchmarks recorded.\n")
+        emit("No pipeline benchmarks recorded.\n")
 
     # ----- Section 5: Overall Ranking -----
-    lines.append("## 5. Overall Ranking (by Full Parse Speed)\n")
+    emit("## 5. Overall Ranking (by Full Parse Speed)\n")
 
-    if parse_records:
+    if parse_buckets:
         # Aggregate: average mean_s per library across all files
-        lib_times = {}
-        for r in parse_records:
-            lib = f"{r['library']} ({r['language']})"
-            if lib not in lib_times:
-                lib_times[lib] = []
-            if r["mean_s"] > 0:
-                lib_times[lib].append(r["mean_s"])
-
-        ranking = []
-        for lib, times in lib_times.items():
-            if times:
-                avg = sum(times) / len(times)
-                ranking.append((lib, avg, len(times)))
-
-        ranking.sort(key=lambda x: x[1])
-
-        lines.append("| Rank | Library | Avg Parse Time | Files Tested |")
-        lines.append("|------|---------|----------------|--------------|")
+        ranking = rank_libraries(r for bucket in parse_buckets.values() for r in bucket["records"])
+
+        emit("| Rank | Library | Avg Parse Time | Files Tested |")
+        emit("|------|---------|----------------|--------------|")
         for i, (lib, avg, count) in enumerate(ranking, 1):
             medal = {1: " (fastest)", 2: "", 3: ""}.get(i, "")
-            lines.append(f"| {i} | {lib}{medal} | {format_time(avg)} | {count} |")
-        lines.append("")
+            emit(f"| {i} | {lib}{medal} | {format_time(avg)} | {count} |")
+        emit("")
 
         if len(ranking) > 1 and ranking[0][1] > 0:
             fastest = ranking[0]
-            lines.append(f"**Fastest**: {fastest[0]} at {format_time(fastest[1])} average\n")
+            emit(f"**Fastest**: {fastest[0]} at {format_time(fastest[1])} average\n")
             for lib, avg, _ in ranking[1:]:
                 if fastest[1] > 0:
                     ratio = avg / fastest[1]
-                    lines.append(f"- {lib}: {ratio:.1f}x slower")
-            lines.append("")
+                    emit(f"- {lib}: {ratio:.1f}x slower")
+            emit("")
 
     # ----- Section 6: Errors and Failures -----
     if err_records:
-        lines.append("## 6. Errors and Failures\n")
-        lines.append("| Library | Test | Status | Error |")
-        lines.append("|---------|------|--------|-------|")
+        emit("## 6. Errors and Failures\n")
+        emit("| Library | Test | Status | Error |")
+        emit("|---------|------|--------|-------|")
         for r in err_records:
-            err_msg = r.get("error", "")[:80]
-            lines.append(
-                f"| {r['library']} | {r['test']} | {r['status']} | {err_msg} |"
+            err_msg = r.error[:80]
+            emit(
+                f"| {r.library} | {r.test} | {r.status} | {err_msg} |"
             )
-        lines.append("")
+        emit("")
 
     # ----- Section 7: Summary -----
-    lines.append("## 7. Summary\n")
+    emit("## 7. Summary\n")
 
     vcd_libs = set()
     fst_libs = set()
     for r in ok_records:
-        if r["format"] in ("vcd", "vcd+fst"):
-            vcd_libs.add(r["library"])
-        if r["format"] in ("fst", "vcd+fst"):
-            fst_libs.add(r["library"])
-
-    lines.append(f"- **VCD libraries tested**: {', '.join(sorted(vcd_libs)) or 'none'}")
-    lines.append(f"- **FST libraries tested**: {', '.join(sorted(fst_libs)) or 'none'}")
-    lines.append(f"- **Scale**: {scale}")
-    lines.append("")
-    lines.append("### Key Takeaways\n")
-    lines.append("- Rust libraries generally parse faster than Python due to lower interpreter overhead")
-    lines.append("- FST format offers better compression but parse speed depends on implementation")
-    lines.append("- wellen provides the most comprehensive format support (VCD + FST + GHW)")
-    lines.append("- For VCD streaming use cases, rust-vcd and vcd-ng offer low-memory alternatives")
-    lines.append("- For FST, fst-reader (pure Rust) avoids C dependency unlike fstapi")
-    lines.append("")
-
-    report_text = "\n".join(lines)
+        if r.format in ("vcd", "vcd+fst"):
+            vcd_libs.add(r.library)
+        if r.format in ("fst", "vcd+fst"):
+            fst_libs.add(r.library)
+
+    emit(f"- **VCD libraries tested**: {', '.join(sorted(vcd_libs)) or 'none'}")
+    emit(f"- **FST libraries tested**: {', '.join(sorted(fst_libs)) or 'none'}")
+    emit(f"- **Scale**: {scale}")
+    emit("")
+    emit("### Key Takeaways\n")
+    emit("- Rust libraries generally parse faster than Python due to lower interpreter overhead")
+    emit("- FST format offers better compression but parse speed depends on implementation")
+    emit("- wellen provides the most comprehensive format support (VCD + FST + GHW)")
+    emit("- For VCD streaming use cases, rust-vcd and vcd-ng offer low-memory alternatives")
+    emit("- For FST, fst-reader (pure Rust) avoids C dependency unlike fstapi")
 
+
+def generate_report(records, scale, output_path):
+    """Generate a Markdown report from normalized records."""
     output = Path(output_path)
     output.parent.mkdir(parents=True, exist_ok=True)
-    with open(output, "w") as f:
-        f.write(report_text)
+    # newline="" keeps "\n" line endings on every platform
+    with open(output, "w", encoding="utf-8", newline="", buffering=1 << 16) as f:
+        write_report(f, records, scale)
 
     log(f"Report written to {output}")
     return str(output)
@@ -372,13 +529,22 @@ def generate_report(records, scale, output_path):
 def main():
     parser = argparse.ArgumentParser(description="Generate benchmark comparison report")
     parser.add_argument("--results-dir", default="results", help="Directory with JSON results")
-    parser.add_argument("--scale", default="all", help="Scale to report on (small/medium/large/all)")
+    parser.add_argument("--scale", default="all",
+                        help="Scale(s) to report on (small/medium/large, comma-separated, or all)")
     parser.add_argument(
         "--output",
         default="",
         help="Output file path (default: results/benchmark_report.md)",
     )
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Read the combined results for --scale from stdin instead of the results dir",
+    )
     args = parser.parse_args()
+    scales = ["small", "medium", "large"] if args.scale == "all" else args.scale.split(",")
+    if args.stdin and len(scales) > 1:
+        parser.error("--stdin needs a single --scale")
 
     results_dir = Path(args.results_dir)
     if not results_dir.exists():
@@ -388,18 +554,17 @@ def main():
     all_records = []
     scales_found = []
 
-    if args.scale == "all":
-        for s in ["small", "medium", "large"]:
-            combined = load_combined(results_dir, s)
+    if len(scales) > 1 or args.scale == "all":
+        # The loads are independent; read and decode them concurrently
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(scales)) as ex:
+            futures = [ex.submit(load_combined, results_dir, s) for s in scales]
+        for s, fut in zip(scales, futures):
+            combined = fut.result()
             if combined is not None:
-                recs = normalize_results(combined)
-                # Tag each record with its scale
-                for r in recs:
-                    r["scale"] = s
-                all_records.extend(recs)
+                all_records.extend(normalize_results(combined, s))
                 scales_found.append(s)
     else:
-        combined = load_combined(results_dir, args.scale)
+        combined = _loads(sys.stdin.buffer.read()) if args.stdin else load_combined(results_dir, args.scale)
         if combined is not None:
             all_records = normalize_results(combined)
             scales_found.append(args.scale)
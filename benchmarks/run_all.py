@@ -9,15 +9,32 @@ Usage:
     python run_all.py --scale medium             # Standard run
     python run_all.py --scale large              # Extreme test (100MB+ files)
     python run_all.py --scale small --skip-rust  # Python only
+    python run_all.py --scales small,medium      # Several scales, one report
+    python run_all.py --dry-run                  # Walk the steps, run nothing
 """
 
 import argparse
+import collections
+import concurrent.futures
+import functools
+import importlib.util
 import json
 import os
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import traceback
 from pathlib import Path
+from typing import NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 BENCH_DIR = Path(__file__).parent.resolve()
 DATA_DIR = BENCH_DIR / "data"
@@ -25,263 +42,719 @@ PYTHON_DIR = BENCH_DIR / "python"
 RUST_DIR = BENCH_DIR / "rust"
 RESULTS_DIR = BENCH_DIR / "results"
 
+# Sizes and mtimes of the generated test data per scale, so an unchanged
+# data set is recognised without regenerating or re-inspecting it
+MANIFEST_PATH = DATA_DIR / ".manifest.json"
+
 # Subprocess timeout per scale (seconds)
 SCALE_TIMEOUTS = {"small": 300, "medium": 600, "large": 1200}
 
+class BenchSpec(NamedTuple):
+    """One Python benchmark script, its venv and its output file."""
+    script_path: Path
+    venv_name: str
+    venv_python: Path
+    output_file: Path
+    description: str
+
+
+def _bench_spec(script_name, venv_name, description):
+    return BenchSpec(
+        script_path=PYTHON_DIR / script_name,
+        venv_name=venv_name,
+        venv_python=PYTHON_DIR / venv_name / "bin" / "python",
+        output_file=RESULTS_DIR / f"{venv_name.strip('.')}.json",
+        description=description,
+    )
+
+
 # Python benchmarks: (script_name, venv_name, description)
-PYTHON_BENCHMARKS = [
+_PYTHON_BENCHMARK_ENTRIES = [
     ("bench_vcdvcd.py", ".venv_vcdvcd", "vcdvcd (Python VCD)"),
     ("bench_pylibfst.py", ".venv_pylibfst", "pylibfst (Python FST)"),
     ("bench_pywellen.py", ".venv_pywellen", "pywellen (Python VCD+FST)"),
 ]
+# ... with their paths resolved once
+PYTHON_BENCHMARKS = [_bench_spec(*entry) for entry in _PYTHON_BENCHMARK_ENTRIES]
+
+
+# Parser for the JSON that wave-bench and the Python benchmarks print (orjson
+# when installed; its JSONDecodeError subclasses json's)
+_loads = orjson.loads if orjson is not None else json.loads
+
+_log_lock = threading.Lock()
 
 
 def log(msg):
-    print(f"[run_all] {msg}", file=sys.stderr, flush=True)
+    # Python benchmarks may run on worker threads (--jobs); keep lines whole
+    with _log_lock:
+        print(f"[run_all] {msg}", file=sys.stderr, flush=True)
+
+
+def log_block(prefix, text, tail=None):
+    """log() each line of *text* (only the last *tail* lines, if given) with one write."""
+    lines = text.strip().splitlines()
+    if tail is not None:
+        lines = lines[-tail:]
+    block = "".join(f"[run_all] {prefix}{line}\n" for line in lines)
+    with _log_lock:
+        sys.stderr.write(block)
+        sys.stderr.flush()
+
+
+def dump_json(obj):
+    """*obj* as 2-space indented JSON bytes (with orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode()
+
+
+def write_json(path, obj):
+    """Write *obj* to *path* as 2-space indented JSON."""
+    with open(path, "wb") as f:
+        f.write(dump_json(obj))
+
+
+def iter_json_chunks(doc):
+    """Yield dump_json(*doc*) for a dict *doc* in pieces, one list element at a time.
+
+    The concatenated chunks equal dump_json(doc), but the whole document is
+    never held as one string.
+    """
+    if not doc:
+        yield dump_json(doc)
+        return
+    yield b"{\n"
+    last = len(doc) - 1
+    for n, (key, value) in enumerate(doc.items()):
+        end = b",\n" if n < last else b"\n"
+        if isinstance(value, list) and value:
+            yield b"  " + dump_json(key) + b": [\n"
+            for i, item in enumerate(value):
+                yield (b",\n    " if i else b"    ") + dump_json(item).replace(b"\n", b"\n    ")
+            yield b"\n  ]" + end
+        else:
+            yield b"  " + dump_json(key) + b": " + dump_json(value).replace(b"\n", b"\n  ") + end
+    yield b"}"
+
+
+# Set for every child: fixed str hashing, so dict/set iteration order (and
+# any timing that depends on it) is the same from run to run, and no .pyc
+# writes sneaking into a timed import
+CHILD_ENV = {"PYTHONHASHSEED": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+
+
+def parse_cpu_list(text):
+    """CPU set from a taskset-style list such as "0-1,4"."""
+    cpus = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _tee_to_file(path, chunks):
+    """Yield *chunks* unchanged, writing each one to *path* as it passes."""
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
+
+def _drain(chunks):
+    for _ in chunks:
+        pass
+
 
+def _feed(stream, data):
+    """Writer thread body: send *data* (bytes or an iterable of bytes) to a child's stdin.
 
-def run_subprocess(cmd, cwd=None, timeout=600, description=""):
-    """Run a subprocess with timeout. Returns (stdout, stderr, returncode)."""
+    If the child stops reading, an iterable is still run to its end, since it
+    may be writing a file as it goes (see _tee_to_file).
+    """
+    chunks = iter([data] if isinstance(data, bytes) else data)
+    try:
+        for chunk in chunks:
+            stream.buffer.write(chunk)
+        stream.close()
+    except BrokenPipeError:
+        _drain(chunks)
+
+
+# Lines of child output kept per stream; older lines are dropped so a child
+# flooding its pipes cannot run the orchestrator out of memory
+STDOUT_MAX_LINES = 4096
+STDERR_MAX_LINES = 1024
+
+
+class _LineTail:
+    """The last *maxlen* lines appended (all of them if None), counting the dropped ones."""
+
+    def __init__(self, maxlen):
+        self.lines = collections.deque(maxlen=maxlen)
+        self.dropped = 0
+
+    def append(self, line):
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(line)
+
+
+def _pump(stream, sink, echo, on_line):
+    """Reader thread body: collect lines of a child pipe as they arrive.
+
+    *sink* is a _LineTail, or None to keep no lines.
+    """
+    for line in stream:
+        if sink is not None:
+            sink.append(line)
+        if on_line is not None:
+            on_line(line)
+        if echo and line.strip():
+            log(f"    {line.rstrip()}")
+    stream.close()
+
+
+def _kill_group(proc):
+    """SIGKILL the child's whole process group (it leads its own session)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+    proc.wait()
+
+
+# Children started by run_subprocess that are still running, on any thread.
+# Each leads its own session, so the terminal's SIGINT does not reach them;
+# kill_children() is what stops them when the orchestrator is interrupted.
+_live_procs = set()
+_live_procs_lock = threading.Lock()
+
+
+def kill_children():
+    """Kill the process group of every child still running."""
+    with _live_procs_lock:
+        procs = list(_live_procs)
+    for proc in procs:
+        _kill_group(proc)
+
+
+@functools.lru_cache(maxsize=None)
+def _taskset():
+    """Path of the taskset binary, or None."""
+    return shutil.which("taskset")
+
+
+def run_subprocess(cmd, cwd=None, timeout=600, description="", env=None,
+                   echo_stderr=True, echo_stdout=False, on_stdout_line=None,
+                   stdin_data=None, affinity=None, keep_stdout=True,
+                   stdout_max_lines=STDOUT_MAX_LINES):
+    """Run a subprocess with timeout. Returns (stdout, stderr, returncode).
+
+    Output is read line by line while the child runs: echoed streams reach
+    log() as they are produced, and *on_stdout_line* is called per stdout line.
+    *stdin_data* (bytes or an iterable of bytes), if given, is written to the
+    child's stdin. Only the last *stdout_max_lines* / STDERR_MAX_LINES lines
+    are returned; pass stdout_max_lines=None when stdout is parsed as a whole,
+    so none of it is dropped. With keep_stdout=False no stdout is kept at all
+    (for callers that consume it through *on_stdout_line*).
+
+    The child starts a new session, so a timeout (or Ctrl-C here) kills its
+    whole process group, including the measurement processes the bench
+    scripts fork, rather than leaving them running. It gets CHILD_ENV on top
+    of *env* (default: this environment) and, with *affinity*, is restricted
+    to that set of CPUs: started under taskset when it is installed, else
+    pinned right after it starts (before it can fork measurement children).
+    preexec_fn is not used for this, as it is unsafe with the reader and
+    worker threads running here.
+    """
     log(f"  Running: {description or ' '.join(str(c) for c in cmd)}")
+    if affinity is not None and _taskset():
+        cmd = [_taskset(), "-c", ",".join(map(str, sorted(affinity))), *cmd]
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
             cwd=cwd,
-            capture_output=True,
+            env={**(os.environ if env is None else env), **CHILD_ENV},
+            stdin=subprocess.PIPE if stdin_data is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=timeout,
+            bufsize=1,
+            start_new_session=True,
         )
-        return result.stdout, result.stderr, result.returncode
-    except subprocess.TimeoutExpired:
-        log(f"  TIMEOUT after {timeout}s: {description}")
-        return "", f"TIMEOUT after {timeout}s", -1
     except FileNotFoundError as e:
         log(f"  NOT FOUND: {e}")
         return "", str(e), -2
     except Exception as e:
         log(f"  ERROR: {e}")
         return "", str(e), -3
+    with _live_procs_lock:
+        _live_procs.add(proc)
+    if affinity is not None and not _taskset():
+        try:
+            os.sched_setaffinity(proc.pid, affinity)
+        except ProcessLookupError:
+            pass
+    try:
+        return _collect(proc, timeout, description, echo_stderr, echo_stdout,
+                        on_stdout_line, stdin_data, keep_stdout, stdout_max_lines)
+    finally:
+        with _live_procs_lock:
+            _live_procs.discard(proc)
+
+
+def _collect(proc, timeout, description, echo_stderr, echo_stdout,
+             on_stdout_line, stdin_data, keep_stdout, stdout_max_lines):
+    """Read a started child's output until it exits or times out (see run_subprocess)."""
+    stdout_buf = _LineTail(stdout_max_lines) if keep_stdout else None
+    stderr_buf = _LineTail(STDERR_MAX_LINES)
+    readers = [
+        threading.Thread(target=_pump, args=(proc.stdout, stdout_buf, echo_stdout, on_stdout_line), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, stderr_buf, echo_stderr, None), daemon=True),
+    ]
+    feeder = None
+    if stdin_data is not None:
+        feeder = threading.Thread(target=_feed, args=(proc.stdin, stdin_data), daemon=True)
+        readers.append(feeder)
+    for t in readers:
+        t.start()
+    try:
+        rc = proc.wait(timeout=timeout)
+    except KeyboardInterrupt:
+        _kill_group(proc)
+        raise
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        # The caller may go on to drain the iterable the feeder is consuming
+        # (see _tee_to_file), so the feeder must be done first. With the
+        # child gone its writes fail at once, so this join returns promptly.
+        if feeder is not None:
+            feeder.join()
+        # A grandchild that left the group may hold the pipes open; don't wait on it
+        for t in readers:
+            t.join(timeout=5)
+        log(f"  TIMEOUT after {timeout}s: {description}")
+        return "", f"TIMEOUT after {timeout}s", -1
+    for t in readers:
+        t.join()
+    for name, buf in [("stdout", stdout_buf), ("stderr", stderr_buf)]:
+        if buf is not None and buf.dropped:
+            log(f"  [{name} truncated: {buf.dropped} lines dropped, last {buf.lines.maxlen} retained]")
+    return "".join(stdout_buf.lines if stdout_buf else ()), "".join(stderr_buf.lines), rc
+
+
+_DRY_RUN_STDOUT = '{"library": "stub", "format": "vcd", "results": []}\n'
 
 
-def ensure_test_data(scale, datagen_python):
-    """Generate test data if it doesn't exist."""
-    # Check if data files exist for this scale
-    vcd_file = DATA_DIR / f"bench_{scale}.vcd"
-    fst_file = DATA_DIR / f"bench_{scale}.fst"
+def _dry_run_subprocess(cmd, *, description="", on_stdout_line=None, **_):
+    """run_subprocess stand-in for --dry-run: runs nothing, prints empty stub results."""
+    log(f"  [dry-run] {description or ' '.join(str(c) for c in cmd)}")
+    if on_stdout_line is not None:
+        on_stdout_line(_DRY_RUN_STDOUT)
+    return _DRY_RUN_STDOUT, "", 0
 
-    if vcd_file.exists() and fst_file.exists():
-        vcd_size = vcd_file.stat().st_size
-        fst_size = fst_file.stat().st_size
-        log(f"Test data exists: VCD={vcd_size / 1024 / 1024:.1f}MB, FST={fst_size / 1024 / 1024:.1f}MB")
+
+# Every child process is started through this; --dry-run swaps in the stub
+RUN_SUBPROCESS = run_subprocess
+
+
+def _data_signatures(scale):
+    """{"vcd": [size, mtime_ns] or None, "fst": ...} for bench_<scale>.* in DATA_DIR.
+
+    One scandir pass over DATA_DIR instead of an exists() + stat() per file.
+    """
+    names = {f"bench_{scale}.vcd": "vcd", f"bench_{scale}.fst": "fst"}
+    signatures = {"vcd": None, "fst": None}
+    try:
+        with os.scandir(DATA_DIR) as it:
+            for entry in it:
+                kind = names.get(entry.name)
+                if kind is not None and entry.is_file():
+                    st = entry.stat()
+                    signatures[kind] = [st.st_size, st.st_mtime_ns]
+    except FileNotFoundError:
+        pass
+    return signatures
+
+
+def effective_data_dir(scale):
+    """DATA_DIR/<scale> if that subdirectory exists, else DATA_DIR itself."""
+    scale_data_dir = DATA_DIR / scale
+    return str(scale_data_dir) if scale_data_dir.is_dir() else str(DATA_DIR)
+
+
+def _load_manifest():
+    """The {scale: {"vcd": signature, "fst": signature}} data manifest, or {}."""
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _record_manifest(scale, signatures):
+    if RUN_SUBPROCESS is _dry_run_subprocess:
+        # --dry-run leaves the real data directory untouched
+        return
+    manifest = _load_manifest()
+    manifest[scale] = signatures
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def ensure_test_data(scales, datagen_python=None, force=False):
+    """Generate test data for each of *scales* that doesn't have it (or all, with *force*).
+
+    The missing scales are generated by a single generate_testdata.py run.
+    *datagen_python* defaults to find_datagen_python(), looked up only when
+    data actually has to be generated. Returns True if every scale has VCD data.
+    """
+    missing = []
+    for scale in scales:
+        # Check if data files exist for this scale
+        signatures = _data_signatures(scale)
+        if force or not (signatures["vcd"] and signatures["fst"]):
+            missing.append(scale)
+        elif _load_manifest().get(scale) == signatures:
+            # Files unchanged since they were last generated or checked
+            log(f"Test data for {scale} up to date (matches manifest)")
+        else:
+            if sys.stderr.isatty():
+                vcd_size = signatures["vcd"][0]
+                fst_size = signatures["fst"][0]
+                log(f"Test data for {scale} exists: VCD={vcd_size / 1024 / 1024:.1f}MB, "
+                    f"FST={fst_size / 1024 / 1024:.1f}MB")
+            else:
+                # Plain message in captured logs (CI), where the sizes are rarely read
+                log(f"Test data for {scale} exists")
+            _record_manifest(scale, signatures)
+    if not missing:
         return True
 
-    log(f"Generating test data for scale={scale}...")
+    log(f"Generating test data for scale={','.join(missing)}...")
     gen_script = BENCH_DIR / "generate_testdata.py"
     if not gen_script.exists():
         log(f"ERROR: {gen_script} not found")
         return False
-
-    stdout, stderr, rc = run_subprocess(
-        [datagen_python, str(gen_script), "--scale", scale, "--data-dir", str(DATA_DIR)],
-        timeout=SCALE_TIMEOUTS.get(scale, 600),
-        description=f"generate_testdata.py --scale {scale}",
+    if datagen_python is None:
+        datagen_python = find_datagen_python()
+        log(f"  Using Python for datagen: {datagen_python}")
+
+    stdout, stderr, rc = RUN_SUBPROCESS(
+        [datagen_python, str(gen_script), "--scale", *missing, "--data-dir", str(DATA_DIR)],
+        timeout=sum(SCALE_TIMEOUTS.get(scale, 600) for scale in missing),
+        description=f"generate_testdata.py --scale {' '.join(missing)}",
+        echo_stdout=True,
     )
-    if stderr:
-        for line in stderr.strip().split("\n"):
-            log(f"    {line}")
-    if stdout:
-        for line in stdout.strip().split("\n"):
-            log(f"    {line}")
 
     if rc != 0:
         log(f"WARNING: Data generation returned code {rc}")
-    return vcd_file.exists()
+    ok = True
+    for scale in missing:
+        signatures = _data_signatures(scale)
+        if rc == 0 and signatures["vcd"] and signatures["fst"]:
+            _record_manifest(scale, signatures)
+        ok = ok and signatures["vcd"] is not None
+    return ok
+
+
+# Modules generate_testdata.py imports (it writes VCD itself, FST through pylibfst)
+DATAGEN_MODULES = ("numpy", "pylibfst")
+
+
+@functools.lru_cache(maxsize=None)
+def _venv_has(venv_python, modules):
+    """True if *venv_python* can import every module in the *modules* tuple."""
+    _, _, rc = RUN_SUBPROCESS(
+        [venv_python, "-c", f"import {', '.join(modules)}"],
+        timeout=60,
+        description=f"{venv_python} -c 'import {', '.join(modules)}'",
+        echo_stderr=False,
+    )
+    return rc == 0
 
 
+@functools.lru_cache(maxsize=None)
 def find_datagen_python():
-    """Find a Python interpreter that has pyvcd and pylibfst for data generation."""
-    # pylibfst venv needs both pyvcd and pylibfst for generating both formats
+    """Find a Python interpreter that has numpy and pylibfst for data generation.
+
+    Each candidate venv is checked by importing the modules, so a broken venv
+    is passed over here rather than failing half way through generating data.
+    """
     for venv in [".venv_pylibfst", ".venv_vcdvcd"]:
         python = PYTHON_DIR / venv / "bin" / "python"
-        if python.exists():
+        if python.exists() and _venv_has(str(python), DATAGEN_MODULES):
             return str(python)
     # Fall back to system python
     return sys.executable
 
 
-def run_python_benchmarks(scale, timeout):
-    """Run all Python benchmark scripts, return list of result dicts."""
-    all_results = []
-
-    for script_name, venv_name, description in PYTHON_BENCHMARKS:
-        log(f"\n--- Python: {description} ---")
-
-        script_path = PYTHON_DIR / script_name
-        if not script_path.exists():
-            log(f"  SKIP: {script_path} not found")
-            all_results.append({
-                "library": description,
-                "format": "unknown",
-                "results": [{
-                    "test": "setup",
-                    "scale": scale,
-                    "file": "",
-                    "file_size_bytes": 0,
-                    "times_s": [],
-                    "mean_s": 0,
-                    "stdev_s": 0,
-                    "memory_kb": 0,
-                    "status": "error",
-                    "error": f"Script not found: {script_path}",
-                }],
-            })
-            continue
+def _venv_site_packages(venv_python):
+    """site-packages of the venv owning *venv_python*, for this interpreter's version."""
+    version = f"python{sys.version_info.major}.{sys.version_info.minor}"
+    return Path(venv_python).parent.parent / "lib" / version / "site-packages"
 
-        venv_python = PYTHON_DIR / venv_name / "bin" / "python"
-        if not venv_python.exists():
-            log(f"  SKIP: venv not found at {venv_python}")
-            log(f"  Run 'bash benchmarks/python/setup_envs.sh' first")
-            all_results.append({
-                "library": description,
-                "format": "unknown",
-                "results": [{
-                    "test": "setup",
-                    "scale": scale,
-                    "file": "",
-                    "file_size_bytes": 0,
-                    "times_s": [],
-                    "mean_s": 0,
-                    "stdev_s": 0,
-                    "memory_kb": 0,
-                    "status": "error",
-                    "error": f"venv not found: {venv_python}. Run setup_envs.sh first.",
-                }],
-            })
-            continue
 
-        output_file = RESULTS_DIR / f"{venv_name.strip('.')}.json"
+def run_bench_inproc(script_path, venv_python, argv):
+    """Run a bench script's main(argv) in this interpreter with the venv's packages.
 
-        # Use scale-specific subdirectory if it exists
-        scale_data_dir = DATA_DIR / scale
-        effective_data_dir = str(scale_data_dir) if scale_data_dir.is_dir() else str(DATA_DIR)
+    The venv's site-packages is put at the front of sys.path for the call, and
+    the bench module plus everything imported from the venv is dropped from
+    sys.modules afterwards. Returns ("", "", returncode) like run_subprocess,
+    or None when the venv was built for a different Python version (its
+    compiled packages cannot be loaded here).
 
-        stdout, stderr, rc = run_subprocess(
-            [
-                str(venv_python),
-                str(script_path),
-                "--data-dir", effective_data_dir,
-                "--scale", scale,
-                "--output", str(output_file),
-            ],
+    Unlike the subprocess path there is no timeout: the run cannot be killed.
+    """
+    site_packages = _venv_site_packages(venv_python)
+    if not site_packages.is_dir():
+        return None
+    log(f"  Running in-process: {Path(script_path).name} {' '.join(argv)}")
+    saved_path = sys.path[:]
+    saved_modules = set(sys.modules)
+    sys.path[:0] = [str(site_packages), str(Path(script_path).parent)]
+    rc = 0
+    try:
+        spec = importlib.util.spec_from_file_location("bench_mod", script_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["bench_mod"] = module
+        spec.loader.exec_module(module)
+        module.main(argv)
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        log(f"  ERROR in {Path(script_path).name}:")
+        log_block("    ", traceback.format_exc())
+        rc = 1
+    finally:
+        sys.path[:] = saved_path
+        prefix = str(site_packages)
+        for name in set(sys.modules) - saved_modules:
+            mod_file = getattr(sys.modules[name], "__file__", None) or ""
+            if name == "bench_mod" or mod_file.startswith(prefix):
+                del sys.modules[name]
+    return "", "", rc
+
+
+# Fields of a per-test result record; error records fill in the rest
+_RESULT_TEMPLATE = {
+    "test": "",
+    "scale": "",
+    "file": "",
+    "file_size_bytes": 0,
+    "times_s": [],
+    "mean_s": 0,
+    "stdev_s": 0,
+    "memory_kb": 0,
+    "status": "error",
+    "error": "",
+}
+
+
+def _make_err(library, fmt="unknown", **fields):
+    """A result document for *library* holding one error/timeout record."""
+    record = dict(_RESULT_TEMPLATE, times_s=[], **fields)
+    return {"library": library, "format": fmt, "results": [record]}
+
+
+def _run_one_python_bench(spec, scale, timeout, data_dir, in_process=False, cpus=None):
+    """Run one PYTHON_BENCHMARKS entry; return its result dicts (none if it produced no JSON)."""
+    script_path, venv_name, venv_python, output_file, description = spec
+    results = []
+
+    log(f"\n--- Python: {description} ---")
+
+    if not script_path.exists():
+        log(f"  SKIP: {script_path} not found")
+        results.append(_make_err(description, test="setup", scale=scale,
+                                 error=f"Script not found: {script_path}"))
+        return results
+
+    if not venv_python.exists():
+        log(f"  SKIP: venv not found at {venv_python}")
+        log(f"  Run 'bash benchmarks/python/setup_envs.sh' first")
+        results.append(_make_err(description, test="setup", scale=scale,
+                                 error=f"venv not found: {venv_python}. Run setup_envs.sh first."))
+        return results
+
+    bench_args = ["--data-dir", data_dir, "--scale", scale]
+    outcome = None
+    if in_process:
+        output_file.unlink(missing_ok=True)
+        outcome = run_bench_inproc(script_path, venv_python, [*bench_args, "--output", str(output_file)])
+        if outcome is None:
+            log(f"  {venv_name} is not a Python {sys.version_info.major}.{sys.version_info.minor} venv; "
+                f"running in a subprocess")
+    if outcome is None:
+        # Without --output the script prints its JSON; parse it from memory
+        # and keep a copy in output_file instead of reading the file back
+        env = None
+        if cpus is not None:
+            # pylibfst pins its timing worker to $BENCH_CORE; keep it in the set
+            env = dict(os.environ, BENCH_CORE=str(min(cpus)))
+        stdout, stderr, rc = RUN_SUBPROCESS(
+            [str(venv_python), str(script_path), *bench_args],
             timeout=timeout,
-            description=f"{script_name} (scale={scale})",
+            description=f"{script_path.name} (scale={scale})",
+            env=env,
+            affinity=cpus,
+            stdout_max_lines=None,  # parsed as one JSON document
         )
-
-        if stderr:
-            for line in stderr.strip().split("\n"):
-                if line.strip():
-                    log(f"    {line}")
-
-        if rc == -1:
-            # Timeout
-            all_results.append({
-                "library": description,
-                "format": "unknown",
-                "results": [{
-                    "test": "all",
-                    "scale": scale,
-                    "file": "",
-                    "file_size_bytes": 0,
-                    "times_s": [],
-                    "mean_s": 0,
-                    "stdev_s": 0,
-                    "memory_kb": 0,
-                    "status": "timeout",
-                    "error": f"Subprocess timed out after {timeout}s",
-                }],
-            })
-        elif output_file.exists():
-            try:
-                with open(output_file) as f:
-                    data = json.load(f)
-                all_results.append(data)
-                ok_count = sum(1 for r in data.get("results", []) if r.get("status") == "ok")
-                total = len(data.get("results", []))
-                log(f"  Done: {ok_count}/{total} tests passed")
-            except json.JSONDecodeError as e:
-                log(f"  ERROR parsing output: {e}")
-                all_results.append({
-                    "library": description,
-                    "format": "unknown",
-                    "results": [{
-                        "test": "parse_output",
-                        "scale": scale,
-                        "file": "",
-                        "file_size_bytes": 0,
-                        "times_s": [],
-                        "mean_s": 0,
-                        "stdev_s": 0,
-                        "memory_kb": 0,
-                        "status": "error",
-                        "error": f"JSON parse error: {e}",
-                    }],
-                })
-        elif stdout.strip():
-            # Try parsing stdout as JSON
-            try:
-                data = json.loads(stdout)
-                all_results.append(data)
-            except json.JSONDecodeError:
-                log(f"  ERROR: no valid JSON output (rc={rc})")
+        raw = stdout if stdout.strip() else None
+        if raw is not None and rc != -1:
+            output_file.write_text(raw)
+    else:
+        stdout, stderr, rc = outcome
+        raw = output_file.read_bytes() if output_file.exists() else None
+
+    if rc == -1:
+        # Timeout
+        results.append(_make_err(description, test="all", scale=scale, status="timeout",
+                                 error=f"Subprocess timed out after {timeout}s"))
+    elif raw is not None:
+        try:
+            data = _loads(raw)
+        except ValueError as e:
+            log(f"  ERROR parsing output: {e}")
+            results.append(_make_err(description, test="parse_output", scale=scale,
+                                     error=f"JSON parse error: {e}"))
         else:
-            log(f"  ERROR: no output (rc={rc})")
+            results.append(data)
+            ok_count = sum(1 for r in data.get("results", []) if r.get("status") == "ok")
+            total = len(data.get("results", []))
+            log(f"  Done: {ok_count}/{total} tests passed")
+    else:
+        log(f"  ERROR: no output (rc={rc})")
 
-    return all_results
+    return results
 
 
-def run_rust_benchmarks(scale, timeout):
-    """Build and run Rust benchmark, return list of result dicts."""
-    log("\n--- Rust benchmarks ---")
+def run_python_benchmarks(scale, timeout, jobs=1, in_process=False, cpus=None):
+    """Run all Python benchmark scripts, return list of result dicts.
+
+    With jobs > 1 up to that many scripts run at once. Each uses its own venv
+    and output file, but concurrent runs compete for CPU and memory bandwidth,
+    so the default stays serial for comparable timings.
+
+    With *in_process* each script runs in this interpreter (run_bench_inproc)
+    instead of a fresh one; that swaps sys.path, so the scripts then run serially.
+    *cpus* restricts the benchmark subprocesses to that CPU set.
+    """
+    # Use scale-specific subdirectory if it exists
+    data_dir = effective_data_dir(scale)
+    if in_process:
+        jobs = 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+        futures = [ex.submit(_run_one_python_bench, spec, scale, timeout, data_dir, in_process, cpus)
+                   for spec in PYTHON_BENCHMARKS]
+    # Collect in PYTHON_BENCHMARKS order so combined results do not depend on timing
+    return [data for fut in futures for data in fut.result()]
 
+
+RUST_BINARY = RUST_DIR / "target" / "release" / "wave-bench"
+
+
+def _rust_build_inputs():
+    """Yield the files whose changes require rebuilding wave-bench.
+
+    Covers the crate's own sources, Cargo.toml/Cargo.lock, and the sources of
+    every `path = "..."` dependency (the submodules benchmarked here).
+    """
     cargo_toml = RUST_DIR / "Cargo.toml"
-    if not cargo_toml.exists():
-        log(f"  SKIP: {cargo_toml} not found")
-        return []
+    crates = [RUST_DIR]
+    for line in cargo_toml.read_text().splitlines():
+        _, sep, rest = line.partition('path = "')
+        if sep:
+            crates.append((RUST_DIR / rest.split('"', 1)[0]).resolve())
+    yield RUST_DIR / "Cargo.lock"
+    for crate in crates:
+        yield crate / "Cargo.toml"
+        yield from (crate / "src").rglob("*.rs")
+
+
+def rust_build_up_to_date():
+    """True when the wave-bench binary is newer than all of its build inputs."""
+    try:
+        bin_mtime = RUST_BINARY.stat().st_mtime
+    except OSError:
+        return False
+    for path in _rust_build_inputs():
+        try:
+            if path.stat().st_mtime >= bin_mtime:
+                return False
+        except OSError:
+            continue
+    return True
 
-    # Build
-    log("  Building (cargo build --release)...")
-    stdout, stderr, rc = run_subprocess(
+
+def _cargo_build(force=False):
+    if not force and rust_build_up_to_date():
+        log("  Build up-to-date, skipping")
+        return "", "", 0
+    return RUN_SUBPROCESS(
         ["cargo", "build", "--release"],
         cwd=str(RUST_DIR),
         timeout=300,
         description="cargo build --release",
+        echo_stderr=False,  # only the tail is logged, on failure
     )
+
+
+def start_rust_build(force=False):
+    """Start `cargo build --release` on a background thread.
+
+    Returns a Future of the (stdout, stderr, returncode) triple, or None when
+    there is no Cargo.toml to build. Unless *force* is set, cargo is not run
+    at all when the binary is already up to date.
+    """
+    if not (RUST_DIR / "Cargo.toml").exists():
+        return None
+    log("  Starting cargo build --release in the background...")
+    build = concurrent.futures.Future()
+
+    def run():
+        try:
+            build.set_result(_cargo_build(force))
+        except BaseException as e:
+            build.set_exception(e)
+
+    # A daemon thread, so an interrupted run exits without waiting for cargo
+    # (kill_children() stops cargo itself)
+    threading.Thread(target=run, name="cargo-build", daemon=True).start()
+    return build
+
+
+def run_rust_benchmarks(scale, timeout, build=None, force_build=False, cpus=None):
+    """Build and run Rust benchmark, return list of result dicts.
+
+    *build* is a Future from start_rust_build(); without one the build runs here.
+    *cpus* restricts wave-bench (not the build) to that CPU set.
+    """
+    log("\n--- Rust benchmarks ---")
+
+    cargo_toml = RUST_DIR / "Cargo.toml"
+    if not cargo_toml.exists():
+        log(f"  SKIP: {cargo_toml} not found")
+        return []
+
+    # Build
+    if build is not None:
+        stdout, stderr, rc = build.result()
+    else:
+        log("  Building (cargo build --release)...")
+        stdout, stderr, rc = _cargo_build(force_build)
     if rc != 0:
         log(f"  BUILD FAILED (rc={rc})")
         if stderr:
-            for line in stderr.strip().split("\n")[-20:]:
-                log(f"    {line}")
-        return [{
-            "library": "rust-all",
-            "format": "mixed",
-            "results": [{
-                "test": "build",
-                "scale": scale,
-                "file": "",
-                "file_size_bytes": 0,
-                "times_s": [],
-                "mean_s": 0,
-                "stdev_s": 0,
-                "memory_kb": 0,
-                "status": "error",
-                "error": f"cargo build failed (rc={rc})",
-            }],
-        }]
+            log_block("    ", stderr, tail=20)
+        return [_make_err("rust-all", fmt="mixed", test="build", scale=scale,
+                          error=f"cargo build failed (rc={rc})")]
 
     log("  Build successful")
 
     # Run
-    binary = RUST_DIR / "target" / "release" / "wave-bench"
+    binary = RUST_BINARY
     if not binary.exists():
         log(f"  ERROR: binary not found at {binary}")
         return []
@@ -290,69 +763,43 @@ def run_rust_benchmarks(scale, timeout):
     scale_timeout_map = {"small": 60, "medium": 120, "large": 300}
     rust_timeout = scale_timeout_map.get(scale, 120)
 
-    # Use scale-specific subdirectory if it exists
-    scale_data_dir = DATA_DIR / scale
-    effective_data_dir = str(scale_data_dir) if scale_data_dir.is_dir() else str(DATA_DIR)
-
     env = os.environ.copy()
-    env["DATA_DIR"] = effective_data_dir
+    # Use scale-specific subdirectory if it exists
+    env["DATA_DIR"] = effective_data_dir(scale)
     env["TIMEOUT"] = str(rust_timeout)
     env["REPS"] = "3"
 
-    log(f"  Running wave-bench (DATA_DIR={DATA_DIR}, TIMEOUT={rust_timeout}s)...")
+    log(f"  Running wave-bench (DATA_DIR={env['DATA_DIR']}, TIMEOUT={rust_timeout}s)...")
 
-    try:
-        result = subprocess.run(
-            [str(binary)],
-            env=env,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-        stdout = result.stdout
-        stderr = result.stderr
-        rc = result.returncode
-    except subprocess.TimeoutExpired:
-        log(f"  TIMEOUT after {timeout}s")
-        return [{
-            "library": "rust-all",
-            "format": "mixed",
-            "results": [{
-                "test": "all",
-                "scale": scale,
-                "file": "",
-                "file_size_bytes": 0,
-                "times_s": [],
-                "mean_s": 0,
-                "stdev_s": 0,
-                "memory_kb": 0,
-                "status": "timeout",
-                "error": f"Rust benchmark timed out after {timeout}s",
-            }],
-        }]
-
-    if stderr:
-        for line in stderr.strip().split("\n"):
-            if line.strip():
-                log(f"    {line}")
-
-    # Parse JSON lines from stdout
+    # Each stdout line is one JSON result; parse them as they arrive
     rust_results = []
-    for line in stdout.strip().split("\n"):
-        line = line.strip()
-        if not line:
-            continue
+
+    def collect(line):
+        # Results are JSON objects; skip blank and other lines without parsing
+        if not line.startswith("{"):
+            return
         try:
-            obj = json.loads(line)
-            rust_results.append(obj)
+            rust_results.append(_loads(line))
         except json.JSONDecodeError:
             pass
 
+    _, _, rc = RUN_SUBPROCESS(
+        [str(binary)],
+        env=env,
+        timeout=timeout,
+        description="wave-bench",
+        on_stdout_line=collect,
+        affinity=cpus,
+        keep_stdout=False,  # collect() keeps the parsed results
+    )
+    if rc == -1:
+        return [_make_err("rust-all", fmt="mixed", test="all", scale=scale, status="timeout",
+                          error=f"Rust benchmark timed out after {timeout}s")]
+
     # Save raw Rust results
     if rust_results:
         rust_output = RESULTS_DIR / "rust_bench.json"
-        with open(rust_output, "w") as f:
-            json.dump(rust_results, f, indent=2)
+        write_json(rust_output, rust_results)
         log(f"  Done: {len(rust_results)} benchmark results collected")
 
     return rust_results
@@ -366,84 +813,165 @@ def main():
         default="small",
         help="Benchmark scale (default: small)",
     )
+    parser.add_argument(
+        "--scales",
+        default="",
+        help="Comma-separated scales to run in one go, e.g. small,medium "
+             "(overrides --scale; data for all of them is generated by one datagen run)",
+    )
     parser.add_argument("--skip-python", action="store_true", help="Skip Python benchmarks")
+    parser.add_argument(
+        "--force-regen",
+        action="store_true",
+        help="Regenerate test data even if it exists",
+    )
     parser.add_argument("--skip-rust", action="store_true", help="Skip Rust benchmarks")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run Python benchmarks in this interpreter with each venv's "
+                             "site-packages on sys.path, instead of one subprocess per venv "
+                             "(no per-script timeout)")
+    parser.add_argument("--force-build", action="store_true",
+                        help="Run cargo build even if wave-bench looks up to date")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Python benchmark scripts to run concurrently (default: 1; >1 skews timings)",
+    )
     parser.add_argument(
         "--timeout",
         type=int,
         default=0,
         help="Override subprocess timeout in seconds (0=auto based on scale)",
     )
+    parser.add_argument(
+        "--python-cpus",
+        type=parse_cpu_list,
+        default=None,
+        help="Pin the Python benchmark processes to these CPUs, e.g. 0-1 (default: no pinning)",
+    )
+    parser.add_argument(
+        "--rust-cpus",
+        type=parse_cpu_list,
+        default=None,
+        help="Pin wave-bench to these CPUs, e.g. 2-5 (default: no pinning; "
+             "wellen is multi-threaded, so fewer CPUs lowers its numbers)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Walk through every step without starting any process (stub results "
+             "go to a temporary results dir); for working on this script",
+    )
     args = parser.parse_args()
-
-    scale = args.scale
-    timeout = args.timeout or SCALE_TIMEOUTS.get(scale, 600)
+    scales = args.scales.split(",") if args.scales else [args.scale]
+    unknown = [s for s in scales if s not in SCALE_TIMEOUTS]
+    if unknown:
+        parser.error(f"--scales: unknown scale(s): {', '.join(unknown)}")
+    if args.dry_run and "large" in scales:
+        parser.error("--dry-run cannot be combined with --scale large")
+    for opt, cpus in [("--python-cpus", args.python_cpus), ("--rust-cpus", args.rust_cpus)]:
+        if cpus is None:
+            continue
+        if not hasattr(os, "sched_setaffinity"):
+            parser.error(f"{opt}: CPU pinning is not supported on this platform")
+        unavailable = cpus - os.sched_getaffinity(0)
+        if unavailable:
+            parser.error(f"{opt}: CPU(s) {', '.join(map(str, sorted(unavailable)))} not available here")
+
+    if args.dry_run:
+        global RUN_SUBPROCESS, RESULTS_DIR, PYTHON_BENCHMARKS
+        RUN_SUBPROCESS = _dry_run_subprocess
+        RESULTS_DIR = Path(tempfile.mkdtemp(prefix="run_all_dry_run_"))
+        PYTHON_BENCHMARKS = [_bench_spec(*entry) for entry in _PYTHON_BENCHMARK_ENTRIES]
+        args.in_process = False
 
     RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
     log("=" * 60)
     log("VCD/FST Library Benchmark Suite")
-    log(f"  Scale: {scale}")
-    log(f"  Timeout: {timeout}s")
+    log(f"  Scale: {', '.join(scales)}")
+    log(f"  Timeout: {args.timeout or ', '.join(str(SCALE_TIMEOUTS[s]) for s in scales)}s")
     log(f"  Data dir: {DATA_DIR}")
     log(f"  Results dir: {RESULTS_DIR}")
     log("=" * 60)
 
     t_start = time.perf_counter()
 
-    # Step 1: Ensure test data
+    # Step 1: Ensure test data, compiling the Rust benchmark meanwhile
     log("\n[Step 1] Ensuring test data...")
-    datagen_python = find_datagen_python()
-    log(f"  Using Python for datagen: {datagen_python}")
-    if not ensure_test_data(scale, datagen_python):
+    rust_build = start_rust_build(args.force_build) if not args.skip_rust else None
+    if not ensure_test_data(scales, force=args.force_regen):
         log("WARNING: Test data generation may have failed. Continuing anyway...")
-
-    # Step 2: Python benchmarks
-    python_results = []
-    if not args.skip_python:
-        log("\n[Step 2] Running Python benchmarks...")
-        python_results = run_python_benchmarks(scale, timeout)
-    else:
-        log("\n[Step 2] Skipping Python benchmarks (--skip-python)")
-
-    # Step 3: Rust benchmarks
-    rust_results = []
-    if not args.skip_rust:
-        log("\n[Step 3] Running Rust benchmarks...")
-        rust_results = run_rust_benchmarks(scale, timeout)
-    else:
-        log("\n[Step 3] Skipping Rust benchmarks (--skip-rust)")
-
-    # Step 4: Save combined results
-    log("\n[Step 4] Saving results...")
-    combined = {
-        "scale": scale,
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "python_results": python_results,
-        "rust_results": rust_results,
-    }
-    combined_path = RESULTS_DIR / f"combined_{scale}.json"
-    with open(combined_path, "w") as f:
-        json.dump(combined, f, indent=2)
-    log(f"  Combined results saved to {combined_path}")
-
-    # Step 5: Generate report
+    if rust_build is not None and not args.skip_python:
+        # Let the compile finish first: it would steal CPU from the timed runs
+        log("  Waiting for cargo build before timing Python benchmarks...")
+        concurrent.futures.wait([rust_build])
+
+    for scale in scales:
+        timeout = args.timeout or SCALE_TIMEOUTS.get(scale, 600)
+        if len(scales) > 1:
+            log(f"\n{'=' * 20} scale={scale} {'=' * 20}")
+
+        # Step 2: Python benchmarks
+        python_results = []
+        if not args.skip_python:
+            log("\n[Step 2] Running Python benchmarks...")
+            python_results = run_python_benchmarks(scale, timeout, jobs=args.jobs,
+                                                   in_process=args.in_process,
+                                                   cpus=args.python_cpus)
+        else:
+            log("\n[Step 2] Skipping Python benchmarks (--skip-python)")
+
+        # Step 3: Rust benchmarks
+        rust_results = []
+        if not args.skip_rust:
+            log("\n[Step 3] Running Rust benchmarks...")
+            rust_results = run_rust_benchmarks(scale, timeout, build=rust_build,
+                                               force_build=args.force_build,
+                                               cpus=args.rust_cpus)
+        else:
+            log("\n[Step 3] Skipping Rust benchmarks (--skip-rust)")
+
+        # Step 4: Save combined results
+        log("\n[Step 4] Saving results...")
+        combined = {
+            "scale": scale,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python_results": python_results,
+            "rust_results": rust_results,
+        }
+        combined_path = RESULTS_DIR / f"combined_{scale}.json"
+        # Encoded and written one result document at a time
+        chunks = _tee_to_file(combined_path, iter_json_chunks(combined))
+        if len(scales) > 1:
+            _drain(chunks)
+            log(f"  Combined results saved to {combined_path}")
+
+    # Step 5: Generate report (once, over every scale run)
     log("\n[Step 5] Generating report...")
     report_script = BENCH_DIR / "report.py"
+    report_cmd = [sys.executable, str(report_script), "--results-dir", str(RESULTS_DIR),
+                  "--scale", ",".join(scales)]
+    report_input = None
+    if len(scales) == 1:
+        # report.py reads the results on stdin while they are written to the file
+        report_cmd.append("--stdin")
+        report_input = chunks
     if report_script.exists():
-        stdout, stderr, rc = run_subprocess(
-            [sys.executable, str(report_script), "--results-dir", str(RESULTS_DIR), "--scale", scale],
+        stdout, stderr, rc = RUN_SUBPROCESS(
+            report_cmd,
             timeout=60,
             description="report.py",
+            stdin_data=report_input,
         )
-        if stderr:
-            for line in stderr.strip().split("\n"):
-                if line.strip():
-                    log(f"    {line}")
         if rc != 0:
             log(f"  Report generation failed (rc={rc})")
     else:
         log(f"  WARNING: {report_script} not found, skipping report generation")
+    if len(scales) == 1:
+        _drain(chunks)  # writes the file if report.py did not consume it
+        log(f"  Combined results saved to {combined_path}")
 
     elapsed = time.perf_counter() - t_start
     log(f"\n{'=' * 60}")
@@ -453,4 +981,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except KeyboardInterrupt:
+        kill_children()
+        log("Interrupted")
+        sys.exit(130)